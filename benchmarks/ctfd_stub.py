@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Minimal stand-in for the CTFd API to try /import against locally, e.g.
+# /import url:http://127.0.0.1:8000 token:benchmark
+# With --solve-interval a further challenge is reported solved every few seconds,
+# to try /ctf ctfd and the solve poller.
+
+import argparse
+import asyncio
+import hashlib
+import json
+
+from aiohttp import web
+
+CATEGORIES = ["web", "pwn", "rev", "crypto", "misc"]
+
+
+def make_challenges(count: int) -> list[dict]:
+    return [
+        {
+            "id": i + 1,
+            "type": "standard",
+            "name": f"Challenge {i + 1}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "value": 100 + 50 * (i % 5),
+            "description": f"Description of challenge {i + 1}",
+        }
+        for i in range(count)
+    ]
+
+
+def create_app(
+    challenges: list[dict],
+    token: str | None = None,
+    solve_interval: float | None = None
+) -> web.Application:
+    by_id = {chall["id"]: chall for chall in challenges}
+    solved: set[int] = set()
+
+    def check_token(request: web.Request):
+        if token and request.headers.get("Authorization") != f"Token {token}":
+            raise web.HTTPForbidden()
+
+    async def list_challenges(request: web.Request) -> web.Response:
+        check_token(request)
+        data = [
+            {key: value for key, value in chall.items() if key != "description"}
+            | {"solved_by_me": chall["id"] in solved}
+            for chall in challenges
+        ]
+        body = json.dumps({"success": True, "data": data})
+        etag = f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=body, content_type="application/json", headers={"ETag": etag})
+
+    async def get_challenge(request: web.Request) -> web.Response:
+        check_token(request)
+        chall = by_id.get(int(request.match_info["chall_id"]))
+        if chall is None:
+            raise web.HTTPNotFound()
+        return web.json_response({"success": True, "data": chall})
+
+    async def solve_challenges(_app: web.Application):
+        async def solve():
+            for chall in challenges:
+                await asyncio.sleep(solve_interval)
+                solved.add(chall["id"])
+
+        task = asyncio.create_task(solve())
+        yield
+        task.cancel()
+
+    app = web.Application()
+    if solve_interval:
+        app.cleanup_ctx.append(solve_challenges)
+    app.router.add_get("/api/v1/challenges", list_challenges)
+    app.router.add_get("/api/v1/challenges/{chall_id:\\d+}", get_challenge)
+    return app
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Serve a fake CTFd API")
+    argparser.add_argument("--challenges", type=int, default=50)
+    argparser.add_argument("--token", default=None)
+    argparser.add_argument("--port", type=int, default=8000)
+    argparser.add_argument("--solve-interval", type=float, default=None,
+                           help="Seconds between challenges being marked solved")
+    args = argparser.parse_args()
+
+    web.run_app(create_app(make_challenges(args.challenges), args.token, args.solve_interval),
+                host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+# Simulated guild, channels, members and interactions for the offline benchmarks and tests.
+# Every method that would be a REST call in discord.py is counted in `api`, and channel
+# changes are forwarded to the channel cache like the gateway events in main.py.
+# The database connection has to be registered before this module is imported.
+
+import asyncio
+import itertools
+import random
+
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import discord
+
+from paolobot.channel_cache import channel_created, channel_deleted, channel_updated
+from paolobot.models.ctf import Ctf
+from paolobot.modules.ctf import CtfCommands
+from paolobot.utils import setup_settings
+
+MESSAGES_PER_PAGE = 100
+
+_ids = itertools.count(1 << 50)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = Counter()
+        self.latency = 0.0
+
+    async def call(self, route: str):
+        self.calls[route] += 1
+        # Always yield so concurrent handlers interleave like they would on real requests
+        await asyncio.sleep(self.latency)
+
+    def reset(self):
+        self.calls.clear()
+
+
+api = FakeApi()
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", name: str):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+    @property
+    def members(self) -> list["FakeMember"]:
+        return [member for member in self.guild.members if self in member.roles]
+
+    async def delete(self, reason: str | None = None):
+        await api.call("delete_role")
+        self.guild.roles.remove(self)
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", name: str, roles: list[FakeRole], bot: bool = False,
+                 administrator: bool = False):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.nick = None
+        self.avatar = None
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.roles = [guild.default_role, *roles]
+        self.guild_permissions = discord.Permissions(administrator=administrator)
+
+    async def add_roles(self, *roles: FakeRole, reason: str | None = None):
+        # discord.py adds roles one request at a time
+        for role in roles:
+            await api.call("add_role")
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles: FakeRole, reason: str | None = None):
+        for role in roles:
+            await api.call("remove_role")
+            if role in self.roles:
+                self.roles.remove(role)
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel", content: str | None = None,
+                 author: FakeMember | None = None, embeds: list[discord.Embed] | None = None,
+                 message_id: int | None = None):
+        self.id = message_id or next_id()
+        self.channel = channel
+        self.content = content or ""
+        self.clean_content = self.content
+        self.author = author
+        self.embeds = embeds or []
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+        self.attachments = []
+        self.mentions = []
+        self.channel_mentions = []
+        self.mention_everyone = False
+        self.reactions = []
+        self.pinned = False
+
+    async def edit(self, **kwargs):
+        await api.call("edit_message")
+        if "content" in kwargs:
+            self.content = self.clean_content = kwargs["content"] or ""
+        if "embeds" in kwargs:
+            self.embeds = kwargs["embeds"]
+        self.edited_at = datetime.now(timezone.utc)
+        return self
+
+    async def delete(self, **_kwargs):
+        await api.call("delete_message")
+
+    async def pin(self, **_kwargs):
+        await api.call("pin_message")
+        self.pinned = True
+
+    async def add_reaction(self, _emoji):
+        await api.call("add_reaction")
+
+
+def _close_files(kwargs: dict):
+    files = list(kwargs.get("files") or [])
+    if kwargs.get("file"):
+        files.append(kwargs["file"])
+    for file in files:
+        file.close()
+
+
+class FakeTextChannel(discord.TextChannel):
+    # Subclassed so the isinstance checks in the handlers pass, the slots of the real
+    # class are filled in directly instead of from a gateway payload
+    def __init__(self, guild: "FakeGuild", name: str, category: "FakeCategory | None",
+                 overwrites: dict | None, position: int):
+        # pylint: disable=super-init-not-called
+        self._state = None
+        self._type = discord.ChannelType.text.value
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.topic = None
+        self.nsfw = False
+        self.position = position
+        self.category_id = category.id if category else None
+        self.fake_overwrites = dict(overwrites or {})
+        self.messages: list[FakeMessage] = []
+        self._messages_by_id: dict[int, FakeMessage] = {}
+
+    @property
+    def overwrites(self) -> dict:
+        return dict(self.fake_overwrites)
+
+    def add_message(self, content: str | None = None, author: FakeMember | None = None,
+                    **kwargs) -> FakeMessage:
+        message = FakeMessage(self, content, author or self.guild.me, **kwargs)
+        self.messages.append(message)
+        self._messages_by_id[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id: int, /) -> FakeMessage:
+        if message_id in self._messages_by_id:
+            return self._messages_by_id[message_id]
+        return FakeMessage(self, message_id=message_id)
+
+    async def send(self, content: str | None = None, **kwargs) -> FakeMessage:
+        await api.call("send_message")
+        _close_files(kwargs)
+        return self.add_message(content, embeds=kwargs.get("embeds"))
+
+    async def pins(self) -> list[FakeMessage]:
+        await api.call("pins")
+        return [message for message in self.messages if message.pinned]
+
+    async def history(self, limit: int | None = 100, oldest_first: bool | None = None, **_kwargs):
+        messages = self.messages if oldest_first else self.messages[::-1]
+        if limit is not None:
+            messages = messages[:limit]
+        for i, message in enumerate(messages):
+            if i % MESSAGES_PER_PAGE == 0:
+                await api.call("history")
+            yield message
+
+    async def set_permissions(self, target, *, overwrite=discord.utils.MISSING,
+                              reason: str | None = None, **permissions):
+        await api.call("set_permissions")
+        if overwrite is discord.utils.MISSING:
+            overwrite = discord.PermissionOverwrite(**permissions)
+        if overwrite is None:
+            self.fake_overwrites.pop(target, None)
+        else:
+            self.fake_overwrites[target] = overwrite
+
+    async def edit(self, *, reason: str | None = None, **options) -> "FakeTextChannel":
+        await api.call("edit_channel")
+        before = SimpleNamespace(id=self.id, category_id=self.category_id)
+        if "name" in options:
+            self.name = options["name"]
+        if "category" in options:
+            self.category_id = options["category"].id if options["category"] else None
+        if "position" in options:
+            self.position = options["position"]
+        if "overwrites" in options:
+            self.fake_overwrites = dict(options["overwrites"])
+        channel_updated(before, self)
+        return self
+
+    async def delete(self, *, reason: str | None = None):
+        await api.call("delete_channel")
+        self.guild.remove_channel(self)
+
+
+class FakeCategory(discord.CategoryChannel):
+    def __init__(self, guild: "FakeGuild", name: str, position: int):
+        # pylint: disable=super-init-not-called
+        self._state = None
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.nsfw = False
+        self.position = position
+        self.category_id = None
+        self._overwrites = []
+
+    async def create_text_channel(self, name: str, *, overwrites: dict | None = None,
+                                  position: int | None = None, **_kwargs) -> FakeTextChannel:
+        await api.call("create_channel")
+        return self.guild.add_text_channel(name, self, overwrites, position)
+
+    async def delete(self, *, reason: str | None = None):
+        await api.call("delete_channel")
+        self.guild.remove_channel(self)
+
+
+class FakeGuild:
+    def __init__(self, name: str):
+        self.id = next_id()
+        self.name = name
+        self.emojis = []
+        self.roles: list[FakeRole] = []
+        self.members: list[FakeMember] = []
+        self._channels: dict[int, FakeTextChannel | FakeCategory] = {}
+        self._next_position = itertools.count()
+
+        self.default_role = self.add_role("@everyone")
+        self.me = self.add_member("PaoloBot", bot=True)
+
+    @property
+    def channels(self) -> list[FakeTextChannel | FakeCategory]:
+        return list(self._channels.values())
+
+    @property
+    def categories(self) -> list[FakeCategory]:
+        return [channel for channel in self._channels.values() if isinstance(channel, FakeCategory)]
+
+    def get_channel(self, channel_id: int | None):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id: int | None) -> FakeRole | None:
+        return discord.utils.get(self.roles, id=role_id)
+
+    def get_member(self, member_id: int) -> FakeMember | None:
+        return discord.utils.get(self.members, id=member_id)
+
+    # Setup helpers, these are not counted as API calls
+    def add_role(self, name: str) -> FakeRole:
+        role = FakeRole(self, name)
+        self.roles.append(role)
+        return role
+
+    def add_member(self, name: str, roles: list[FakeRole] | None = None, **kwargs) -> FakeMember:
+        member = FakeMember(self, name, roles or [], **kwargs)
+        self.members.append(member)
+        return member
+
+    def add_category(self, name: str, position: int | None = None) -> FakeCategory:
+        category = FakeCategory(self, name, self._position(position))
+        self._channels[category.id] = category
+        channel_created(category)
+        return category
+
+    def add_text_channel(self, name: str, category: FakeCategory | None = None,
+                         overwrites: dict | None = None,
+                         position: int | None = None) -> FakeTextChannel:
+        channel = FakeTextChannel(self, name, category, overwrites, self._position(position))
+        self._channels[channel.id] = channel
+        channel_created(channel)
+        return channel
+
+    def remove_channel(self, channel: FakeTextChannel | FakeCategory):
+        del self._channels[channel.id]
+        channel_deleted(channel)
+
+    def _position(self, position: int | None) -> int:
+        return next(self._next_position) if position is None else position
+
+    # Counted API calls
+    async def create_role(self, name: str, **_kwargs) -> FakeRole:
+        await api.call("create_role")
+        return self.add_role(name)
+
+    async def create_category(self, name: str, position: int | None = None,
+                              **_kwargs) -> FakeCategory:
+        await api.call("create_channel")
+        return self.add_category(name, position)
+
+    create_category_channel = create_category
+
+    async def create_text_channel(self, name: str, **kwargs) -> FakeTextChannel:
+        await api.call("create_channel")
+        return self.add_text_channel(name, kwargs.get("category"), kwargs.get("overwrites"))
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, content: bytes):
+        self.filename = filename
+        self.size = len(content)
+        self._content = content
+
+    async def read(self) -> bytes:
+        await api.call("download_attachment")
+        return self._content
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+        self.modal = None
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **_kwargs):
+        await api.call("interaction_response")
+        self._done = True
+
+    async def send_message(self, content: str | None = None, **_kwargs):
+        await api.call("interaction_response")
+        self._done = True
+
+    async def send_modal(self, modal: discord.ui.Modal):
+        await api.call("interaction_response")
+        self._done = True
+        self.modal = modal
+
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, channel: FakeTextChannel, user: FakeMember):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user
+        self.command = None
+        self.extras = {}
+        self.response = FakeResponse()
+
+    async def edit_original_response(self, **_kwargs):
+        await api.call("edit_original_response")
+
+    async def delete_original_response(self):
+        await api.call("delete_original_response")
+
+
+# Guild layout after setup_settings, as used by every scenario
+GUILD_CATEGORIES = [
+    "CTFS",
+    "INCOMPLETE CHALLENGES",
+    "COMPLETE CHALLENGES",
+    "ARCHIVE",
+    "ARCHIVED CTFS",
+]
+
+ctf_commands = CtfCommands(name="ctf")
+
+
+async def setup_guild(members: int) -> FakeGuild:
+    guild = FakeGuild(f"benchmark{random.randrange(1 << 32)}")
+    admin_role = guild.add_role("Team Admin")
+    team_role = guild.add_role("Team Member")
+    for name in GUILD_CATEGORIES:
+        guild.add_category(name)
+    guild.add_text_channel("export")
+    guild.add_text_channel("ctf-invites")
+    guild.general = guild.add_text_channel("general")
+
+    guild.admin = guild.add_member("admin", [admin_role, team_role], administrator=True)
+    for i in range(members):
+        guild.add_member(f"member{i}", [team_role])
+    await setup_settings(guild)
+    return guild
+
+
+async def create_ctf(guild: FakeGuild, name: str) -> Ctf:
+    interaction = FakeInteraction(guild, guild.general, guild.admin)
+    await ctf_commands.create.callback(ctf_commands, interaction, name, None)
+    return Ctf.objects(name=name).first()
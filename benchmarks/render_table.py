@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Compares the cell based /working table renderer with the single image renderer
+# on random work matrices. Does not need Discord or MongoDB.
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+# pylint: disable=wrong-import-position
+from paolobot.modules.challenge import export_table, export_table_fast  # noqa: E402
+
+
+def parse_size(size: str) -> tuple[int, int]:
+    challs, users = size.split("x")
+    return int(challs), int(users)
+
+
+def run(render, work: np.ndarray, repeat: int) -> list[float]:
+    challs = [f"misc-chall{i}" for i in range(work.shape[0])]
+    users = [f"user{i}" for i in range(work.shape[1])]
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render(work, challs, users, Path(tmp) / "overview.png")
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark the /working table renderers")
+    argparser.add_argument("--sizes", type=parse_size, nargs="+",
+                           default=[(20, 10), (50, 20), (100, 60)],
+                           help="Matrix sizes as <challenges>x<users>")
+    argparser.add_argument("--repeat", type=int, default=3)
+    args = argparser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>8} {'renderer':>8} {'mean ms':>9} {'min ms':>9}")
+    for n_challs, n_users in args.sizes:
+        work = rng.choice(np.arange(3, dtype=np.uint8), size=(n_challs, n_users), p=[0.8, 0.1, 0.1])
+        size = f"{n_challs}x{n_users}"
+        for name, render in (("cells", export_table), ("image", export_table_fast)):
+            timings = run(render, work, args.repeat)
+            mean = statistics.mean(timings) * 1000
+            print(f"{size:>8} {name:>8} {mean:>9.1f} {min(timings) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# Drives the command handlers against a simulated guild (benchmarks/fakes.py) and an
+# in-process Mongo stand-in, reporting throughput, latency percentiles and Discord API calls.
+# Requires mongomock (benchmarks/requirements.txt), no Discord connection or MongoDB needed.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import NamedTuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("BACKUPS_DIR", tempfile.mkdtemp(prefix="paolobot_benchmark_"))
+
+# pylint: disable=wrong-import-position
+import mongomock  # noqa: E402
+from mongoengine import connect  # noqa: E402
+from tabulate import tabulate  # noqa: E402
+
+# In-process stand-in for MongoDB, registered before any paolobot module touches the database
+connect(
+    db="paolobot_benchmark",
+    host="mongodb://localhost",
+    mongo_client_class=mongomock.MongoClient
+)
+
+from ctfd_stub import make_challenges  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeAttachment,
+    FakeGuild,
+    FakeInteraction,
+    api,
+    create_ctf,
+    ctf_commands,
+    setup_guild
+)
+from paolobot.models.challenge import Challenge  # noqa: E402
+from paolobot.models.ctf import Ctf  # noqa: E402
+from paolobot.modules.challenge import (  # noqa: E402
+    WorkView,
+    WORK_UPDATE_DELAY,
+    import_challenges
+)
+from paolobot.roles import role_queue  # noqa: E402
+from paolobot.utils import (  # noqa: E402
+    create_channel,
+    get_incomplete_category,
+    get_settings
+)
+
+CHALLENGE_CATEGORIES = ["web", "pwn", "rev", "crypto", "misc", "forensics"]
+
+
+class Result(NamedTuple):
+    name: str
+    ops: int
+    elapsed: float
+    latencies: list[float]
+    calls: dict[str, int]
+
+
+class Timer:
+    def __init__(self):
+        self.latencies = []
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc):
+        self.latencies.append(time.perf_counter() - self.start)
+
+
+async def add_challenges(guild: FakeGuild, ctf_db: Ctf, count: int) -> list[Challenge]:
+    # What /add leaves behind, without going through the modal for every challenge
+    ctf_channel = guild.get_channel(ctf_db.channel_id)
+    incomplete_category = get_incomplete_category(guild)
+    send_work_message = get_settings(guild).send_work_message
+    challs = []
+    for i in range(count):
+        category = CHALLENGE_CATEGORIES[i % len(CHALLENGE_CATEGORIES)]
+        channel = await create_channel(
+            f"{ctf_db.name}-{category}-chall{i}",
+            ctf_channel.overwrites,
+            incomplete_category
+        )
+        channel.add_message(f"# chall{i}\n\nDescription")
+        work_message = channel.add_message() if send_work_message else None
+        challs.append(Challenge(
+            name=f"chall{i}",
+            category=category,
+            channel_id=channel.id,
+            ctf=ctf_db,
+            work_message=work_message.id if work_message else None
+        ))
+    Challenge.objects.insert(challs)
+    return list(Challenge.objects(ctf=ctf_db))
+
+
+async def run_scenario(name: str, ops: int, scenario) -> Result:
+    api.reset()
+    start = time.perf_counter()
+    latencies = await scenario()
+    elapsed = time.perf_counter() - start
+    return Result(name, ops, elapsed, latencies, dict(api.calls))
+
+
+async def bench_create(args) -> Result:
+    guild = await setup_guild(args.members)
+
+    async def scenario():
+        timer = Timer()
+        for i in range(args.iterations):
+            with timer:
+                await create_ctf(guild, f"create{i}_{guild.id}")
+                await role_queue.join()
+        return timer.latencies
+
+    return await run_scenario(
+        f"create CTF with {args.members} members", args.iterations, scenario
+    )
+
+
+async def bench_archive(args) -> Result:
+    guild = await setup_guild(args.members)
+    ctfs = []
+    for i in range(args.iterations):
+        ctf_db = await create_ctf(guild, f"archive{i}_{guild.id}")
+        await add_challenges(guild, ctf_db, args.challenges)
+        ctfs.append(ctf_db)
+    await role_queue.join()
+
+    async def scenario():
+        timer = Timer()
+        for ctf_db in ctfs:
+            ctf_channel = guild.get_channel(ctf_db.channel_id)
+            with timer:
+                await ctf_commands.archive.callback(
+                    ctf_commands, FakeInteraction(guild, ctf_channel, guild.admin)
+                )
+        return timer.latencies
+
+    return await run_scenario(
+        f"archive {args.challenges} challenges", args.iterations, scenario
+    )
+
+
+async def bench_work_clicks(args) -> Result:
+    guild = await setup_guild(args.members)
+    ctf_db = await create_ctf(guild, f"work_{guild.id}")
+    challs = await add_challenges(guild, ctf_db, args.challenges)
+    await role_queue.join()
+    view = WorkView()
+
+    async def scenario():
+        timer = Timer()
+        for _ in range(args.clicks):
+            chall = random.choice(challs)
+            interaction = FakeInteraction(
+                guild,
+                guild.get_channel(chall.channel_id),
+                random.choice(guild.members)
+            )
+            with timer:
+                await WorkView.set_working(view, interaction, None)
+        # Let the debounced work message edits go out
+        await asyncio.sleep(WORK_UPDATE_DELAY * 2)
+        return timer.latencies
+
+    return await run_scenario(f"{args.clicks} WorkView clicks", args.clicks, scenario)
+
+
+async def bench_import(args) -> Result:
+    guild = await setup_guild(args.members)
+    get_settings(guild).update(enforce_categories=False)
+    ctfs = [await create_ctf(guild, f"import{i}_{guild.id}") for i in range(args.iterations)]
+    await role_queue.join()
+    content = json.dumps({"success": True, "data": make_challenges(args.imports)}).encode()
+
+    async def scenario():
+        timer = Timer()
+        for ctf_db in ctfs:
+            interaction = FakeInteraction(guild, guild.get_channel(ctf_db.channel_id), guild.admin)
+            with timer:
+                await import_challenges.callback(
+                    interaction, FakeAttachment("challenges.json", content)
+                )
+        # Timings only count if the import went through
+        for ctf_db in ctfs:
+            imported = Challenge.objects(ctf=ctf_db).count()
+            if imported != args.imports:
+                raise RuntimeError(f"Imported {imported} of {args.imports} challenges")
+        return timer.latencies
+
+    return await run_scenario(
+        f"import {args.imports} challenges", args.iterations, scenario
+    )
+
+
+async def bench_export(args) -> Result:
+    guild = await setup_guild(args.members)
+    ctf_db = await create_ctf(guild, f"export_{guild.id}")
+    challs = await add_challenges(guild, ctf_db, args.challenges)
+    await role_queue.join()
+
+    channels = [guild.get_channel(chall.channel_id) for chall in challs]
+    for i in range(args.messages):
+        channels[i % len(channels)].add_message(
+            f"message {i}", author=random.choice(guild.members)
+        )
+
+    async def scenario():
+        timer = Timer()
+        ctf_channel = guild.get_channel(ctf_db.channel_id)
+        with timer:
+            await ctf_commands.export.callback(
+                ctf_commands, FakeInteraction(guild, ctf_channel, guild.admin)
+            )
+        return timer.latencies
+
+    return await run_scenario(f"export {args.messages} messages", args.messages, scenario)
+
+
+SCENARIOS = {
+    "create": bench_create,
+    "archive": bench_archive,
+    "work": bench_work_clicks,
+    "import": bench_import,
+    "export": bench_export,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def format_calls(calls: dict[str, int]) -> str:
+    top = sorted(calls.items(), key=lambda item: item[1], reverse=True)
+    return ", ".join(f"{route}={count}" for route, count in top)
+
+
+async def run(args) -> list[Result]:
+    api.latency = args.api_latency / 1000
+    return [await SCENARIOS[name](args) for name in args.scenarios]
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Benchmark command handlers against a simulated guild"
+    )
+    argparser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    argparser.add_argument("--members", type=int, default=200)
+    argparser.add_argument("--challenges", type=int, default=80)
+    argparser.add_argument("--clicks", type=int, default=1000)
+    argparser.add_argument("--messages", type=int, default=50000)
+    argparser.add_argument("--imports", type=int, default=50)
+    argparser.add_argument("--iterations", type=int, default=3)
+    argparser.add_argument("--api-latency", type=float, default=0,
+                           help="Simulated latency of each Discord API call in ms")
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(run(args))
+
+    table = [
+        [
+            result.name,
+            f"{result.ops / result.elapsed:.1f}",
+            f"{percentile(result.latencies, 0.5) * 1000:.2f}",
+            f"{percentile(result.latencies, 0.95) * 1000:.2f}",
+            f"{percentile(result.latencies, 0.99) * 1000:.2f}",
+            sum(result.calls.values()),
+            format_calls(result.calls),
+        ]
+        for result in results
+    ]
+    print(tabulate(
+        table,
+        headers=["scenario", "ops/s", "p50 ms", "p95 ms", "p99 ms", "API calls", "by route"]
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import bisect
+import heapq
+
+from paolobot.models.ctf import Ctf
+from paolobot.models.ctf_category import CtfCategory
+
+MAX_CHOICES = 25
+
+
+class PrefixIndex:
+    # Sorted list of names, prefix lookups are a pair of binary searches
+    def __init__(self, weights: dict[str, int] | None = None):
+        self._weights = dict(weights or {})
+        self._names = sorted(self._weights)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._weights
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def weight(self, name: str) -> int:
+        return self._weights.get(name, 0)
+
+    def add(self, name: str, weight: int = 0):
+        if name not in self._weights:
+            bisect.insort(self._names, name)
+        self._weights[name] = weight
+
+    def remove(self, name: str):
+        if self._weights.pop(name, None) is not None:
+            del self._names[bisect.bisect_left(self._names, name)]
+
+    def increment(self, name: str, amount: int = 1):
+        self.add(name, self._weights.get(name, 0) + amount)
+
+    def _top(self, names: list[str], limit: int, by_weight: bool) -> list[str]:
+        if by_weight:
+            return heapq.nsmallest(limit, names, key=lambda name: -self._weights[name])
+        return names[:limit]
+
+    def search(self, current: str, limit: int = MAX_CHOICES, by_weight: bool = False) -> list[str]:
+        start = bisect.bisect_left(self._names, current)
+        end = bisect.bisect_left(self._names, current + "\U0010ffff", lo=start)
+        matches = self._top(self._names[start:end], limit, by_weight)
+
+        # Fill up with names containing the input elsewhere
+        if current and len(matches) < limit:
+            substring_matches = [
+                name for name in self._names
+                if current in name and not name.startswith(current)
+            ]
+            matches += self._top(substring_matches, limit - len(matches), by_weight)
+        return matches
+
+
+_ctf_index: PrefixIndex | None = None  # pylint: disable=invalid-name
+_category_indexes: dict[int, PrefixIndex] = {}
+
+
+def get_ctf_index() -> PrefixIndex:
+    # Names of all active CTFs
+    global _ctf_index  # pylint: disable=global-statement
+    if _ctf_index is None:
+        _ctf_index = PrefixIndex({ctf.name: 0 for ctf in Ctf.objects(archived=False).only("name")})
+    return _ctf_index
+
+
+def get_category_index(guild_id: int) -> PrefixIndex:
+    # CTF category names of a guild weighted by usage count
+    if guild_id not in _category_indexes:
+        _category_indexes[guild_id] = PrefixIndex({
+            category.name: category.count
+            for category in CtfCategory.objects(guild_id=guild_id).only("name", "count")
+        })
+    return _category_indexes[guild_id]
@@ -0,0 +1,80 @@
+from statistics import mean
+from typing import NamedTuple
+
+import discord
+
+from paolobot.models.challenge import Challenge
+from paolobot.models.ctf import Ctf
+from paolobot.utils import MAX_CHANNELS
+
+CHANNEL_MARGIN = 3
+CAPACITY_WARNING = 50
+# Expected channels of a CTF when there are no finished CTFs to learn from
+DEFAULT_CTF_CHANNELS = 30
+
+
+class CtfUsage(NamedTuple):
+    ctf: Ctf
+    channels: int
+
+
+def get_ctf_usage(guild: discord.Guild) -> list[CtfUsage]:
+    # Channels per CTF of this guild, counted from the guild cache without API calls
+    channel_ids = [channel.id for channel in guild.channels]
+    ctfs = list(Ctf.objects(channel_id__in=channel_ids).order_by("id"))
+    counts = {ctf.id: 1 for ctf in ctfs}
+    for chall in Challenge.objects(ctf__in=list(counts)).only("ctf", "channel_id").as_pymongo():
+        if guild.get_channel(chall["channel_id"]):
+            counts[chall["ctf"]] += 1
+    return [CtfUsage(ctf, counts[ctf.id]) for ctf in ctfs]
+
+
+class CapacityPlan:
+    def __init__(self, guild: discord.Guild):
+        self.limit = MAX_CHANNELS
+        self.used = len(guild.channels)
+
+        usage = get_ctf_usage(guild)
+        self.running = [ctf_usage for ctf_usage in usage if not ctf_usage.ctf.archived]
+        # Oldest first
+        self.archived = [ctf_usage for ctf_usage in usage if ctf_usage.ctf.archived]
+
+        if self.archived:
+            self.ctf_channels = round(mean(ctf_usage.channels for ctf_usage in self.archived))
+        else:
+            self.ctf_channels = DEFAULT_CTF_CHANNELS
+        self.expected_growth = sum(
+            max(self.ctf_channels - ctf_usage.channels, 0) for ctf_usage in self.running
+        )
+
+    @property
+    def free(self) -> int:
+        return self.limit - CHANNEL_MARGIN - self.used
+
+    @property
+    def projected_free(self) -> int:
+        # Free channels once running CTFs reach the size of an average CTF
+        return self.free - self.expected_growth
+
+    def reclaimable(self, needed: int) -> list[CtfUsage]:
+        # Oldest archived CTFs to delete so that `needed` channels are free
+        out = []
+        missing = needed - self.free
+        for ctf_usage in self.archived:
+            if missing <= 0:
+                break
+            out.append(ctf_usage)
+            missing -= ctf_usage.channels
+        return out
+
+    def __str__(self):
+        out = f"Channels: {self.used}/{self.limit}\n"
+        out += f"Running CTFs: {len(self.running)} using "
+        out += f"{sum(ctf_usage.channels for ctf_usage in self.running)} channels\n"
+        out += f"Archived CTFs: {len(self.archived)} using "
+        out += f"{sum(ctf_usage.channels for ctf_usage in self.archived)} channels\n"
+        out += f"Average CTF size: {self.ctf_channels} channels\n"
+        out += f"Projected free channels: {self.projected_free}"
+        if self.projected_free < CAPACITY_WARNING:
+            out += "\n**Warning:** Running CTFs are expected to get close to the channel limit"
+        return out
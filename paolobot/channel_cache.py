@@ -0,0 +1,87 @@
+import bisect
+
+import discord
+
+
+def _position_keys(name: str) -> list:
+    # Challenge channels are named ctf-category-name or ctf-name
+    parts = name.split("-")
+    if len(parts) < 2:
+        return []
+    if len(parts) == 2:
+        return [parts[0], (parts[0], None)]
+    return [parts[0], (parts[0], parts[1])]
+
+
+class CategoryPositions:
+    # Text channels of a category grouped by CTF and by (CTF, category), each group sorted
+    # by position like discord.CategoryChannel.text_channels
+    def __init__(self, channels: list[discord.TextChannel]):
+        self._groups: dict[object, list[tuple[int, int]]] = {}
+        self._entries: dict[int, tuple[tuple[int, int], list]] = {}
+        for channel in channels:
+            self.add(channel)
+
+    def add(self, channel: discord.TextChannel):
+        self.remove(channel.id)
+        entry = (channel.position, channel.id)
+        keys = [None] + _position_keys(channel.name)
+        for key in keys:
+            bisect.insort(self._groups.setdefault(key, []), entry)
+        self._entries[channel.id] = (entry, keys)
+
+    def remove(self, channel_id: int):
+        if channel_id not in self._entries:
+            return
+        entry, keys = self._entries.pop(channel_id)
+        for key in keys:
+            group = self._groups[key]
+            del group[bisect.bisect_left(group, entry)]
+            if not group:
+                del self._groups[key]
+
+    def last_position(self, key=None) -> int | None:
+        group = self._groups.get(key)
+        return group[-1][0] if group else None
+
+
+_category_positions: dict[int, CategoryPositions] = {}
+# Channel IDs in each category, sets so our own updates and gateway events can overlap
+_category_channels: dict[int, set[int]] = {}
+
+
+def get_category_positions(category: discord.CategoryChannel) -> CategoryPositions:
+    if category.id not in _category_positions:
+        _category_positions[category.id] = CategoryPositions(category.text_channels)
+    return _category_positions[category.id]
+
+
+def get_occupancy(category: discord.CategoryChannel) -> int:
+    if category.id not in _category_channels:
+        _category_channels[category.id] = {channel.id for channel in category.channels}
+    return len(_category_channels[category.id])
+
+
+def channel_created(channel: discord.abc.GuildChannel):
+    if channel.category_id in _category_channels:
+        _category_channels[channel.category_id].add(channel.id)
+    if isinstance(channel, discord.TextChannel) and channel.category_id in _category_positions:
+        _category_positions[channel.category_id].add(channel)
+
+
+def channel_deleted(channel: discord.abc.GuildChannel):
+    _category_positions.pop(channel.id, None)
+    _category_channels.pop(channel.id, None)
+    if channel.category_id in _category_channels:
+        _category_channels[channel.category_id].discard(channel.id)
+    if channel.category_id in _category_positions:
+        _category_positions[channel.category_id].remove(channel.id)
+
+
+def channel_updated(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    if before.category_id != after.category_id:
+        if before.category_id in _category_channels:
+            _category_channels[before.category_id].discard(before.id)
+        if before.category_id in _category_positions:
+            _category_positions[before.category_id].remove(before.id)
+    channel_created(after)
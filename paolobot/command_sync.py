@@ -0,0 +1,36 @@
+import hashlib
+import json
+import logging
+
+import discord
+from discord import app_commands
+
+from paolobot.models.command_sync import CommandSync
+
+
+def get_command_hash(tree: app_commands.CommandTree, guild: discord.Object | None) -> str:
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    serialized = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+async def sync_commands(
+    tree: app_commands.CommandTree,
+    guild: discord.Object | None,
+    force: bool = False
+) -> bool:
+    # Command syncs are heavily rate limited, only sync when the commands have changed
+    query = {
+        "application_id": tree.client.application_id,
+        "guild_id": guild.id if guild else 0
+    }
+    schema_hash = get_command_hash(tree, guild)
+    last_sync = CommandSync.objects(**query).first()
+    if not force and last_sync is not None and last_sync.schema_hash == schema_hash:
+        logging.info("Commands are unchanged since the last sync")
+        return False
+
+    await tree.sync(guild=guild)
+    CommandSync.objects(**query).update_one(set__schema_hash=schema_hash, upsert=True)
+    logging.info("Synced commands")
+    return True
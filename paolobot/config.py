@@ -24,7 +24,7 @@ def parse_variable(variable, vartype, default=None, required=False):
 
 BACKUPS_DIR_DEFAULT = (Path(__file__).parent.parent / "backups").resolve()
 
-class Config:
+class Config:  # pylint: disable=too-many-instance-attributes
     def __init__(self):
         # Required
         self.bot_token = parse_variable("BOT_TOKEN", str, required=True)
@@ -34,6 +34,9 @@ class Config:
         self.mongodb_uri = parse_variable("MONGODB_URI", str, default="mongodb://localhost:27017")
         self.mongodb_db = parse_variable("MONGODB_DB", str, default="paolobot")
         self.backups_dir = parse_variable("BACKUPS_DIR", str, default=BACKUPS_DIR_DEFAULT)
+        self.metrics_port = parse_variable("METRICS_PORT", int)
+        self.stall_threshold_ms = parse_variable("STALL_THRESHOLD_MS", int, default=500)
+        self.api_call_budget = parse_variable("API_CALL_BUDGET", int, default=50)
 
 
 config = Config()
@@ -0,0 +1,135 @@
+import asyncio
+import csv
+import io
+import json
+
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from paolobot.scheduler import PRIORITY_BACKGROUND, RequestScheduler
+
+CTFD_RATE = 10.0
+CTFD_BURST = 10
+
+# One scheduler and token bucket per CTFd host, a slow instance does not hold up the others
+_schedulers: dict[str, RequestScheduler] = {}
+
+
+class ImportedChallenge(NamedTuple):
+    name: str
+    category: str | None
+    description: str
+    ctfd_id: int | None
+
+
+class SolvedPoll(NamedTuple):
+    etag: str | None
+    # None when the challenge list has not changed since the last poll
+    solved: list[ImportedChallenge] | None
+
+
+def get_scheduler(url: str) -> RequestScheduler:
+    host = urlsplit(url).netloc
+    if host not in _schedulers:
+        _schedulers[host] = RequestScheduler(f"ctfd {host}", rate=CTFD_RATE, burst=CTFD_BURST)
+    return _schedulers[host]
+
+
+async def close_schedulers():
+    for scheduler in _schedulers.values():
+        await scheduler.close()
+    _schedulers.clear()
+
+
+def api_url(url: str, path: str) -> str:
+    # Accepts the CTF base URL or any URL below its API
+    base = url.rstrip("/")
+    if "/api/v1" in base:
+        base = base[:base.index("/api/v1")]
+    return f"{base}/api/v1/{path}"
+
+
+def auth_headers(token: str | None) -> dict[str, str]:
+    if not token:
+        return {}
+    return {"Authorization": f"Token {token}", "Content-Type": "application/json"}
+
+
+def parse_challenges(data) -> list[ImportedChallenge]:
+    # A CTFd API response, a list of challenges or {"challenges": [...]}
+    if isinstance(data, dict):
+        data = data.get("data", data.get("challenges"))
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of challenges")
+
+    challs = []
+    for entry in data:
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError("Every challenge needs a name")
+        ctfd_id = entry.get("id")
+        if isinstance(ctfd_id, str) and ctfd_id.isdigit():
+            ctfd_id = int(ctfd_id)
+        challs.append(ImportedChallenge(
+            name=str(entry["name"]),
+            category=str(entry["category"]) if entry.get("category") else None,
+            description=str(entry.get("description") or ""),
+            ctfd_id=ctfd_id if isinstance(ctfd_id, int) else None
+        ))
+    return challs
+
+
+def parse_challenge_file(filename: str, content: bytes) -> list[ImportedChallenge]:
+    text = content.decode("utf8")
+    if filename.lower().endswith(".csv"):
+        # Columns: name, category, description and optionally the CTFd id
+        return parse_challenges(list(csv.DictReader(io.StringIO(text))))
+    return parse_challenges(json.loads(text))
+
+
+async def fetch_challenges(url: str, token: str | None = None) -> list[ImportedChallenge]:
+    headers = auth_headers(token)
+    scheduler = get_scheduler(url)
+    result = await scheduler.fetch(api_url(url, "challenges"), headers=headers)
+    if result.status != 200:
+        raise ValueError(f"CTFd returned status {result.status}")
+    challs = parse_challenges(result.json())
+
+    # The challenge list does not include descriptions
+    async def add_description(chall: ImportedChallenge) -> ImportedChallenge:
+        if chall.ctfd_id is None or chall.description:
+            return chall
+        detail = await scheduler.fetch(
+            api_url(url, f"challenges/{chall.ctfd_id}"),
+            headers=headers
+        )
+        if detail.status != 200:
+            return chall
+        return chall._replace(description=detail.json().get("data", {}).get("description") or "")
+
+    return list(await asyncio.gather(*(add_description(chall) for chall in challs)))
+
+
+async def fetch_solved(url: str, token: str | None, etag: str | None = None) -> SolvedPoll:
+    # Challenges solved by the team of the token, a conditional request when an ETag is known
+    headers = auth_headers(token)
+    if etag:
+        headers["If-None-Match"] = etag
+    result = await get_scheduler(url).fetch(
+        api_url(url, "challenges"),
+        priority=PRIORITY_BACKGROUND,
+        headers=headers
+    )
+    if result.status == 304:
+        return SolvedPoll(etag, None)
+    if result.status != 200:
+        raise ValueError(f"CTFd returned status {result.status}")
+
+    data = result.json()
+    entries = data.get("data") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError("Expected a list of challenges")
+    solved = [
+        chall for chall, entry in zip(parse_challenges(entries), entries)
+        if entry.get("solved_by_me")
+    ]
+    return SolvedPoll(result.headers.get("ETag"), solved)
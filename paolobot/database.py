@@ -1,7 +1,56 @@
+import logging
+import re
+
+from datetime import date
+
+from bson import ObjectId
 from mongoengine import connect
+from pymongo.errors import PyMongoError
 
 from paolobot.config import config
+from paolobot.metrics import mongo_timer
+from paolobot.models.attendance import AttendanceRecord
+from paolobot.models.challenge import Challenge
+from paolobot.models.ctf import Ctf
+from paolobot.models.invite import Invite
 
 
-client = connect(db=config.mongodb_db, host=config.mongodb_uri)
+client = connect(db=config.mongodb_db, host=config.mongodb_uri, event_listeners=[mongo_timer])
 db = client[config.mongodb_db]
+
+
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+def check_query_plans():
+    # Warn about hot queries that are not covered by an index, blocking so run in a thread
+    try:
+        _check_query_plans()
+    except PyMongoError as e:
+        logging.error("Could not check query plans: %s", e)
+
+
+def _check_query_plans():
+    for model in (AttendanceRecord, Challenge, Ctf, Invite):
+        model.ensure_indexes()
+
+    ctf_id = ObjectId()
+    hot_queries = {
+        "challenges of CTF": Challenge.objects(ctf=ctf_id),
+        "challenge by name": Challenge.objects(name="chall", category="misc", ctf=ctf_id),
+        "CTF by name": Ctf.objects(name="ctf"),
+        "CTF autocomplete": Ctf.objects(name=re.compile("^c"), archived=False).order_by("name"),
+        "invites of CTF": Invite.objects(ctf=ctf_id),
+        "attendance by date": AttendanceRecord.objects(date=date.today()),
+    }
+    for name, query in hot_queries.items():
+        plan = query.explain().get("queryPlanner", {}).get("winningPlan", {})
+        if _has_collscan(plan):
+            logging.warning("Query \"%s\" is doing a collection scan", name)
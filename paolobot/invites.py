@@ -0,0 +1,45 @@
+from typing import NamedTuple
+
+from paolobot.models.ctf import Ctf
+from paolobot.models.invite import Invite
+
+
+class InviteEntry(NamedTuple):
+    emoji: str
+    role_id: int
+    ctf_id: object
+    ctf_name: str
+    team_access: bool
+
+
+# Invite message ID -> reaction role, so reactions on other messages never touch the DB
+_invites: dict[int, InviteEntry] = {}
+
+
+def load_invites():
+    _invites.clear()
+    for invite in Invite.objects.select_related():
+        if isinstance(invite.ctf, Ctf):
+            add_invite(invite.message_id, invite.emoji, invite.ctf)
+
+
+def add_invite(message_id: int, emoji: str, ctf_db: Ctf):
+    _invites[message_id] = InviteEntry(
+        emoji, ctf_db.role_id, ctf_db.id, ctf_db.name, ctf_db.team_access
+    )
+
+
+def get_invite(message_id: int) -> InviteEntry | None:
+    return _invites.get(message_id)
+
+
+def remove_ctf_invites(ctf_db: Ctf):
+    for message_id, entry in list(_invites.items()):
+        if entry.ctf_id == ctf_db.id:
+            del _invites[message_id]
+
+
+def rename_ctf_invites(ctf_db: Ctf):
+    for message_id, entry in _invites.items():
+        if entry.ctf_id == ctf_db.id:
+            _invites[message_id] = entry._replace(ctf_name=ctf_db.name)
@@ -8,16 +8,34 @@ import pymongo.errors
 from discord import RawReactionActionEvent, app_commands
 
 from paolobot.modules import ctf, ctftime, challenge, notes, bot, attendance
+from paolobot.modules.ctftime import ctftime_scheduler
+from paolobot.ctfd import close_schedulers as close_ctfd_schedulers
+from paolobot.channel_cache import channel_created, channel_deleted, channel_updated
+from paolobot.command_sync import sync_commands
 from paolobot.config import config
-from paolobot.database import db
-from paolobot.models.invite import Invite
-from paolobot.utils import setup_settings
+from paolobot.database import db, check_query_plans
+from paolobot.models.ctf import Ctf
+from paolobot.invites import load_invites, get_invite
+from paolobot.metrics import (
+    MetricsCommandTree,
+    RateLimitHandler,
+    instrument_http,
+    start_metrics_server,
+    finish_command
+)
+from paolobot.roles import role_queue
+from paolobot.utils import setup_settings, setup_all_settings
+from paolobot.watchdog import LoopWatchdog
+from paolobot.work_state import work_buffer
 
 logging.basicConfig(level=logging.INFO)
 
 intents = discord.Intents.all()
 client = discord.Client(intents=intents)
-tree = app_commands.CommandTree(client)
+tree = MetricsCommandTree(client)
+instrument_http(client.http)
+logging.getLogger("discord.http").addHandler(RateLimitHandler())
+background_tasks = set()
 
 GUILD_OBJ = discord.Object(id=config.guild_id) if config.guild_id else None
 challenge.add_commands(tree, GUILD_OBJ)
@@ -30,10 +48,18 @@ attendance.add_commands(tree, GUILD_OBJ)
 
 @client.event
 async def setup_hook():
+    load_invites()
     client.add_view(notes.ModalNoteView())
     client.add_view(notes.HedgeDocNoteView(""))
     client.add_view(challenge.WorkView())
 
+    # Once per process rather than on every reconnect, explain() blocks
+    background_tasks.add(asyncio.create_task(asyncio.to_thread(check_query_plans)))
+    if config.metrics_port:
+        await start_metrics_server(config.metrics_port)
+    stall_threshold = config.stall_threshold_ms / 1000 if config.stall_threshold_ms else None
+    LoopWatchdog(stall_threshold).start(asyncio.get_running_loop())
+
 
 @client.event
 async def on_ready():
@@ -47,11 +73,12 @@ async def on_ready():
         guild = client.get_guild(config.guild_id)
         if guild:
             await setup_settings(guild)
-            await tree.sync(guild=GUILD_OBJ)
+            await sync_commands(tree, GUILD_OBJ)
     else:
-        for guild in client.guilds:
-            await setup_settings(guild)
-        await tree.sync(guild=GUILD_OBJ)
+        await setup_all_settings(client.guilds)
+        await sync_commands(tree, GUILD_OBJ)
+    if not challenge.poll_solves.is_running():
+        challenge.poll_solves.start(client)
     logging.info("%s is online", client.user.name)
 
 
@@ -61,7 +88,25 @@ async def on_guild_join(guild: discord.Guild):
         logging.info("%s has joined guild \"%s\"", client.user.name, guild.name)
         await setup_settings(guild)
         if config.guild_id:
-            await tree.sync(guild=GUILD_OBJ)
+            await sync_commands(tree, GUILD_OBJ)
+
+
+@client.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    channel_created(channel)
+
+
+@client.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    channel_deleted(channel)
+
+
+@client.event
+async def on_guild_channel_update(
+    before: discord.abc.GuildChannel,
+    after: discord.abc.GuildChannel
+):
+    channel_updated(before, after)
 
 
 @client.event
@@ -73,7 +118,7 @@ async def on_raw_reaction_add(reaction: RawReactionActionEvent):
     if config.guild_id is not None and config.guild_id != reaction.guild_id:
         return
 
-    invite = Invite.objects(message_id=reaction.message_id).first()
+    invite = get_invite(reaction.message_id)
     if invite is None or invite.emoji != str(reaction.emoji):
         return
 
@@ -82,11 +127,18 @@ async def on_raw_reaction_add(reaction: RawReactionActionEvent):
     if member is None:
         return
 
-    role = guild.get_role(invite.ctf.role_id)
+    role = guild.get_role(invite.role_id)
     if role is None:
         return
 
-    await member.add_roles(role, reason=f"User {member.name} joined CTF {invite.ctf.name}")
+    reason = f"User {member.name} joined CTF {invite.ctf_name}"
+    if invite.team_access:
+        ctf_db = Ctf.objects(id=invite.ctf_id).first()
+        if ctf_db is not None:
+            await ctf.join_ctf(guild, ctf_db, member, reason)
+        return
+
+    role_queue.add(member, role, reason=reason)
 
 
 @client.event
@@ -98,7 +150,7 @@ async def on_raw_reaction_remove(reaction: RawReactionActionEvent):
     if config.guild_id is not None and config.guild_id != reaction.guild_id:
         return
 
-    invite = Invite.objects(message_id=reaction.message_id).first()
+    invite = get_invite(reaction.message_id)
     if invite is None or invite.emoji != str(reaction.emoji):
         return
 
@@ -107,11 +159,23 @@ async def on_raw_reaction_remove(reaction: RawReactionActionEvent):
     if member is None:
         return
 
-    role = guild.get_role(invite.ctf.role_id)
+    role = guild.get_role(invite.role_id)
     if role is None:
         return
 
-    await member.remove_roles(role, reason=f"User {member.name} left CTF {invite.ctf.name}")
+    reason = f"User {member.name} left CTF {invite.ctf_name}"
+    if invite.team_access:
+        ctf_db = Ctf.objects(id=invite.ctf_id).first()
+        if ctf_db is not None:
+            await ctf.leave_ctf(guild, ctf_db, member, reason)
+        return
+
+    role_queue.remove(member, role, reason=reason)
+
+
+@client.event
+async def on_app_command_completion(interaction: discord.Interaction, _command):
+    finish_command(interaction)
 
 
 @tree.error
@@ -119,6 +183,7 @@ async def on_app_command_error(
     interaction: discord.Interaction,
     error: app_commands.AppCommandError
 ):
+    finish_command(interaction, failed=True)
     try:
         raise error
     except app_commands.CommandInvokeError as e:
@@ -139,7 +204,12 @@ async def on_app_command_error(
 
 async def main():
     async with client:
-        await client.start(config.bot_token)
+        try:
+            await client.start(config.bot_token)
+        finally:
+            work_buffer.flush()
+            await ctftime_scheduler.close()
+            await close_ctfd_schedulers()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+import asyncio
+import bisect
+import contextvars
+import logging
+import time
+
+from collections import Counter
+
+import discord
+from aiohttp import web
+from discord import app_commands
+from pymongo import monitoring
+
+from paolobot.config import config
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+API_CALL_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+METRIC_BUCKETS = {"command_api_calls": API_CALL_BUCKETS}
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the quantile
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+_histograms: dict[tuple[str, tuple], Histogram] = {}
+
+
+def observe(name: str, value: float, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    if key not in _histograms:
+        _histograms[key] = Histogram(METRIC_BUCKETS.get(name, BUCKETS))
+    _histograms[key].observe(value)
+
+
+def get_histograms(name: str) -> dict[tuple, Histogram]:
+    return {labels: hist for (metric, labels), hist in _histograms.items() if metric == name}
+
+
+class CommandTiming:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.mongo = 0.0
+        self.discord = 0.0
+        self.api_calls = Counter()
+
+
+# Timing of the command running in the current task
+current_command: contextvars.ContextVar[CommandTiming | None] = contextvars.ContextVar(
+    "current_command", default=None
+)
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def spawn_background(coro, name: str | None = None) -> asyncio.Task:
+    # Runs a task that outlives the current command in a fresh context, so its API calls
+    # count as background. A reference is kept until it is done.
+    task = asyncio.create_task(coro, name=name, context=contextvars.Context())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+# Discord REST calls by command and route, calls made outside of a command count as "background"
+_api_calls: Counter[tuple[str, str]] = Counter()
+_over_budget: Counter[str] = Counter()
+
+
+def get_api_calls() -> Counter[tuple[str, str]]:
+    return _api_calls
+
+
+def get_over_budget() -> Counter[str]:
+    return _over_budget
+
+
+def start_command(interaction: discord.Interaction):
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    timing = CommandTiming(name)
+    interaction.extras["timing"] = timing
+    current_command.set(timing)
+
+
+def finish_command(interaction: discord.Interaction, failed: bool = False):
+    timing = interaction.extras.pop("timing", None)
+    if timing is None:
+        return
+    labels = {"command": timing.name, "status": "error" if failed else "ok"}
+    observe("command_seconds", time.perf_counter() - timing.start, **labels)
+    observe("command_mongo_seconds", timing.mongo, **labels)
+    observe("command_discord_seconds", timing.discord, **labels)
+
+    api_calls = sum(timing.api_calls.values())
+    observe("command_api_calls", api_calls, **labels)
+    if config.api_call_budget and api_calls > config.api_call_budget:
+        _over_budget[timing.name] += 1
+        logging.warning(
+            "/%s made %d Discord API calls, over the budget of %d: %s",
+            timing.name,
+            api_calls,
+            config.api_call_budget,
+            ", ".join(f"{route} x{count}" for route, count in timing.api_calls.most_common(3))
+        )
+
+
+class MetricsCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        start_command(interaction)
+        return True
+
+
+class MongoTimer(monitoring.CommandListener):
+    def _record(self, event):
+        duration = event.duration_micros / 1e6
+        observe("mongo_query_seconds", duration, operation=event.command_name)
+        if timing := current_command.get():
+            timing.mongo += duration
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+
+def instrument_http(http: discord.http.HTTPClient):
+    request = http.request
+
+    async def timed_request(route: discord.http.Route, **kwargs):
+        route_key = f"{route.method} {route.path}"
+        timing = current_command.get()
+        _api_calls[timing.name if timing else "background", route_key] += 1
+        if timing:
+            timing.api_calls[route_key] += 1
+
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            observe("discord_request_seconds", duration, route=route_key)
+            if timing:
+                timing.discord += duration
+
+    http.request = timed_request
+
+
+class RateLimitHandler(logging.Handler):
+    # discord.py only reports rate limit waits through its logs
+    def emit(self, record: logging.LogRecord):
+        if "rate limit" not in str(record.msg).lower() or not record.args:
+            return
+        delay = record.args[-1]
+        if isinstance(delay, float):
+            observe("discord_rate_limit_seconds", delay)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for (name, labels), hist in sorted(_histograms.items()):
+        label_str = ",".join(f'{key}="{value}"' for key, value in labels)
+        seen = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            seen += count
+            bucket_labels = ",".join(filter(None, [label_str, f'le="{bound}"']))
+            lines.append(f"paolobot_{name}_bucket{{{bucket_labels}}} {seen}")
+        bucket_labels = ",".join(filter(None, [label_str, 'le="+Inf"']))
+        lines.append(f"paolobot_{name}_bucket{{{bucket_labels}}} {hist.count}")
+        lines.append(f"paolobot_{name}_sum{{{label_str}}} {hist.sum}")
+        lines.append(f"paolobot_{name}_count{{{label_str}}} {hist.count}")
+    for (command, route), count in sorted(_api_calls.items()):
+        lines.append(
+            f'paolobot_discord_api_calls_total{{command="{command}",route="{route}"}} {count}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    async def handle_metrics(_request: web.Request) -> web.Response:
+        return web.Response(text=render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    logging.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+    return runner
+
+
+mongo_timer = MongoTimer()
@@ -20,6 +20,7 @@ class AttendanceRecord(Document):
     seconds = IntField(required=True, default=0)
     meta = {
         "indexes": [
-            {"fields": ["user", "date"], "unique": True}
+            {"fields": ["user", "date"], "unique": True},
+            {"fields": ["date"]}
         ]
     }
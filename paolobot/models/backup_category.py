@@ -11,6 +11,8 @@ class BackupCategory(Document):
                 "fields": ["category_id"],
                 "unique": True
             },
-            "original_id"
+            {
+                "fields": ["original_id"]
+            }
         ]
     }
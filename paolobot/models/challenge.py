@@ -26,11 +26,16 @@ class Challenge(Document):
     solvers = ListField(LongField(), default=[])
     working = EmbeddedDocumentListField(Working)
     solved = BooleanField(required=True, default=False)
+    # Challenge ID on the CTFd instance it was imported from
+    ctfd_id = IntField()
     meta = {
         "indexes": [
             {
                 "fields": ["channel_id"],
                 "unique": True
+            },
+            {
+                "fields": ["ctf", "category", "name"]
             }
         ]
     }
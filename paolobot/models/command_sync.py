@@ -0,0 +1,15 @@
+from mongoengine import Document, StringField, LongField
+
+
+class CommandSync(Document):
+    application_id = LongField(required=True)
+    guild_id = LongField(required=True)  # 0 for global commands
+    schema_hash = StringField(required=True)
+    meta = {
+        "indexes": [
+            {
+                "fields": ["application_id", "guild_id"],
+                "unique": True
+            }
+        ]
+    }
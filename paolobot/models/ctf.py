@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, BooleanField, LongField, DictField
+from mongoengine import Document, StringField, BooleanField, LongField, DictField, ListField
 
 
 class Ctf(Document):
@@ -10,11 +10,23 @@ class Ctf(Document):
     password_id = LongField(required=False)
     private = BooleanField(required=True)
     archived = BooleanField(required=True, default=False)
+    # Public CTF where team members get access through a team role overwrite
+    team_access = BooleanField(default=False)
+    left_members = ListField(LongField(), default=[])
+    # CTFd instance that solves are read from
+    ctfd_url = StringField()
+    ctfd_token = StringField()
     meta = {
         "indexes": [
             {
                 "fields": ["channel_id"],
                 "unique": True
+            },
+            {
+                "fields": ["name"]
+            },
+            {
+                "fields": ["archived", "name"]
             }
         ]
     }
@@ -0,0 +1,14 @@
+from mongoengine import Document, StringField, IntField
+
+
+class CtftimeTeam(Document):
+    name = StringField(required=True)
+    team_id = IntField(required=True)
+    meta = {
+        "indexes": [
+            {
+                "fields": ["name"],
+                "unique": True
+            }
+        ]
+    }
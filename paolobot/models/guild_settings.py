@@ -1,4 +1,4 @@
-from mongoengine import Document, LongField, StringField, BooleanField
+from mongoengine import Document, LongField, StringField, BooleanField, IntField
 
 
 class GuildSettings(Document):
@@ -15,8 +15,11 @@ class GuildSettings(Document):
     enforce_categories = BooleanField(default=True)
     send_work_message = BooleanField(default=True)
     use_team_role_as_acl = BooleanField(default=False)
+    team_overwrite_access = BooleanField(default=False)
+    auto_free_channels = BooleanField(default=False)
     hedgedoc_url = StringField(required=True, max_length=100, default="https://demo.hedgedoc.org")
     ctftime_team = StringField(max_length=50)
+    ctftime_team_id = IntField()
     meta = {
         "indexes": [
             {
@@ -16,6 +16,9 @@ class Invite(Document):
             {
                 "fields": ["message_id"],
                 "unique": True
+            },
+            {
+                "fields": ["ctf"]
             }
         ]
     }
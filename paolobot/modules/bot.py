@@ -1,7 +1,14 @@
+from collections import Counter
+
 import discord
 from discord import app_commands
 from mongoengine import ValidationError
+from tabulate import tabulate
 
+from paolobot.command_sync import sync_commands
+from paolobot.config import config
+from paolobot.metrics import get_api_calls, get_histograms, get_over_budget
+from paolobot.modules.ctftime import Ctftime
 from paolobot.utils import is_team_admin, get_settings, MAX_CHANNELS
 
 
@@ -37,11 +44,18 @@ SETTINGS_TYPES = {
     "enforce_categories": bool,
     "send_work_message": bool,
     "use_team_role_as_acl": bool,
+    "team_overwrite_access": bool,
+    "auto_free_channels": bool,
     "hedgedoc_url": str,
     "ctftime_team": str,
 }
 
 class BotCommands(app_commands.Group):
+    def __init__(self, tree: app_commands.CommandTree, guild: discord.Object | None, **kwargs):
+        super().__init__(**kwargs)
+        self.command_tree = tree
+        self.command_guild = guild
+
     @app_commands.command(description="Update guild settings")
     @app_commands.guild_only
     @app_commands.choices(key=[
@@ -78,12 +92,23 @@ class BotCommands(app_commands.Group):
         else:
             raise app_commands.AppCommandError("Invalid key")
 
+        response = "Setting updated"
+        if key == "ctftime_team":
+            # Resolve the team once so later lookups go straight to the team page
+            await interaction.response.defer(ephemeral=True)
+            settings.ctftime_team_id = await Ctftime.resolve_team_id(value)
+            if settings.ctftime_team_id is None:
+                response += ", but the team could not be found on CTFtime"
+
         try:
             settings.save()
         except ValidationError as exc:
             raise app_commands.AppCommandError("Invalid value") from exc
 
-        await interaction.response.send_message("Setting updated", ephemeral=True)
+        if interaction.response.is_done():
+            await interaction.edit_original_response(content=response)
+        else:
+            await interaction.response.send_message(response, ephemeral=True)
 
 
     @app_commands.command(description="Show guild settings and info")
@@ -109,5 +134,95 @@ class BotCommands(app_commands.Group):
         await interaction.response.send_message(response, ephemeral=True)
 
 
+    @app_commands.command(description="Sync slash commands with Discord")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def sync(self, interaction: discord.Interaction, force: bool = True):
+        await interaction.response.defer(ephemeral=True)
+        if await sync_commands(self.command_tree, self.command_guild, force=force):
+            await interaction.edit_original_response(content="Commands synced")
+        else:
+            await interaction.edit_original_response(content="Commands are already up to date")
+
+
+    @app_commands.command(description="Show command latency statistics")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def stats(self, interaction: discord.Interaction):
+        mongo_times = get_histograms("command_mongo_seconds")
+        discord_times = get_histograms("command_discord_seconds")
+        tbl = []
+        for labels, hist in sorted(get_histograms("command_seconds").items()):
+            command = dict(labels)
+            tbl.append([
+                command["command"] + (" (error)" if command["status"] == "error" else ""),
+                hist.count,
+                hist.quantile(0.5),
+                hist.quantile(0.95),
+                mongo_times[labels].mean,
+                discord_times[labels].mean
+            ])
+
+        out = "**Command latency (seconds)**\n```\n"
+        out += tabulate(
+            tbl,
+            headers=["Command", "Count", "p50", "p95", "Mongo avg", "Discord avg"],
+            floatfmt=".03f"
+        )
+        out += "\n"
+        if loop_lag := get_histograms("event_loop_lag_seconds").get(()):
+            out += f"\nEvent loop lag p99: {loop_lag.quantile(0.99):.03f}s"
+        if rate_limits := get_histograms("discord_rate_limit_seconds").get(()):
+            out += f"\nRate limit waits: {rate_limits.count} ({rate_limits.sum:.01f}s total)"
+
+        # Truncate if needed
+        while len(out) > 2000 - 4:
+            out = out[:out.rfind("\n")]
+        out += "\n```"
+        await interaction.response.send_message(out, ephemeral=True)
+
+
+    @app_commands.command(description="Show Discord API calls per command")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def apicalls(self, interaction: discord.Interaction):
+        api_calls = get_api_calls()
+        over_budget = get_over_budget()
+
+        runs = Counter()
+        for labels, hist in get_histograms("command_api_calls").items():
+            runs[dict(labels)["command"]] += hist.count
+
+        totals = Counter()
+        routes: dict[str, Counter] = {}
+        for (command, route), count in api_calls.items():
+            totals[command] += count
+            routes.setdefault(command, Counter())[route] = count
+
+        tbl = []
+        for command, total in totals.most_common():
+            route, route_count = routes[command].most_common(1)[0]
+            tbl.append([
+                command,
+                runs[command] or "-",
+                total,
+                f"{total / runs[command]:.1f}" if runs[command] else "-",
+                over_budget[command],
+                f"{route} ({route_count})"
+            ])
+
+        out = f"**Discord API calls** (budget {config.api_call_budget or 'disabled'})\n```\n"
+        out += tabulate(
+            tbl,
+            headers=["Command", "Runs", "Calls", "Avg", "Over budget", "Top route"]
+        )
+
+        # Truncate if needed
+        while len(out) > 2000 - 4:
+            out = out[:out.rfind("\n")]
+        out += "\n```"
+        await interaction.response.send_message(out, ephemeral=True)
+
+
 def add_commands(tree: app_commands.CommandTree, guild: discord.Object | None):
-    tree.add_command(BotCommands(name="bot"), guild=guild)
+    tree.add_command(BotCommands(tree, guild, name="bot"), guild=guild)
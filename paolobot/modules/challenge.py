@@ -1,27 +1,43 @@
+import asyncio
+import logging
 import re
 import tempfile
 
+from collections import Counter
 from pathlib import Path
 
+import aiohttp
 from discord import app_commands, ui
+from discord.ext import tasks
 import discord
 from mongoengine import NotUniqueError
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
 from matplotlib.table import Table, Cell
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
 
+from paolobot.autocomplete import get_category_index
 from paolobot.models.ctf_category import CtfCategory
 from paolobot.utils import (
     move_channel,
     is_team_admin,
     get_incomplete_category,
     create_channel,
+    delete_channel,
     get_complete_category,
     get_admin_role,
     sanitize_channel_name,
     get_settings,
     MAX_CHANNELS
 )
-from paolobot.modules.ctf import get_ctf_db
+from paolobot.capacity import CapacityPlan
+from paolobot.metrics import spawn_background
+from paolobot.ctfd import fetch_challenges, fetch_solved, parse_challenge_file
+from paolobot.modules.ctf import get_ctf_db, free_channels, free_channels_later
+from paolobot.work_state import ChallengeWork, work_buffer
 
 from paolobot.models.challenge import Challenge
 from paolobot.models.ctf import Ctf
@@ -44,11 +60,10 @@ async def category_autocomplete(
     current: str
 ) -> list[app_commands.Choice[str]]:
     current = sanitize_channel_name(current)
-    query = CtfCategory.objects(
-        name=re.compile("^" + re.escape(current)),
-        guild_id=interaction.guild_id
-    ).order_by("-count")[:25]
-    return [app_commands.Choice(name=c["name"], value=c["name"]) for c in query]
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in get_category_index(interaction.guild_id).search(current, by_weight=True)
+    ]
 
 
 async def category_autocomplete_nullable(
@@ -62,53 +77,83 @@ async def category_autocomplete_nullable(
 
 
 def category_is_valid(category: str, guild_id: int) -> bool:
-    return category is None or CtfCategory.objects(name=category, guild_id=guild_id)
+    return category is None or category in get_category_index(guild_id)
 
 
-def get_work_embeds(chall_db: Challenge):
+def get_work_embeds(chall_work: ChallengeWork):
     embeds = []
     for work_value in WORK_VALUES[1:]:
-        work_list = chall_db.working.filter(value=work_value.value)
-        if work_list:
+        users = [user for user, value in chall_work.users.items() if value == work_value.value]
+        if users:
             embeds.append(discord.Embed(color=work_value.color).add_field(
                 name=work_value.name,
-                value=", ".join(f"<@!{work.user}>" for work in work_list)
+                value=", ".join(f"<@!{user}>" for user in users)
             ))
     return embeds
 
 
-async def update_work_message(chall_db: Challenge, channel: discord.PartialMessageable | None):
-    if channel:
-        message = channel.get_partial_message(chall_db.work_message)
+class WorkMessageUpdater:
+    # Debounces work message edits, only the latest state is sent after a burst of updates.
+    # The last sent state is kept for at most max_sent messages, oldest edits are dropped first.
+    def __init__(self, delay: float, max_sent: int):
+        self.delay = delay
+        self.max_sent = max_sent
+        self._pending: dict[int, tuple[discord.PartialMessage, list[discord.Embed]]] = {}
+        self._sent: dict[int, list[dict]] = {}
+
+    def schedule(self, message: discord.PartialMessage, embeds: list[discord.Embed]):
+        is_new = message.id not in self._pending
+        self._pending[message.id] = (message, embeds)
+        if is_new:
+            # The edit goes out after the command finished, count it as background work
+            spawn_background(self._flush(message.id))
+
+    async def _flush(self, message_id: int):
+        await asyncio.sleep(self.delay)
+        message, embeds = self._pending.pop(message_id)
+
+        rendered = [embed.to_dict() for embed in embeds]
+        if self._sent.get(message_id) == rendered:
+            return
         try:
-            await message.edit(embeds=get_work_embeds(chall_db))
+            await message.edit(embeds=embeds)
         except discord.HTTPException:
-            pass
+            return
+        self._sent.pop(message_id, None)
+        self._sent[message_id] = rendered
+        if len(self._sent) > self.max_sent:
+            del self._sent[next(iter(self._sent))]
+
+    def forget(self, message_id: int | None):
+        # The work message will not be edited anymore
+        self._sent.pop(message_id, None)
+
+
+WORK_UPDATE_DELAY = 0.5
+WORK_SENT_LIMIT = 1000
+work_message_updater = WorkMessageUpdater(WORK_UPDATE_DELAY, WORK_SENT_LIMIT)
+
+
+async def update_work_message(
+    chall_work: ChallengeWork,
+    channel: discord.PartialMessageable | None
+):
+    if channel and chall_work.work_message:
+        message = channel.get_partial_message(chall_work.work_message)
+        work_message_updater.schedule(message, get_work_embeds(chall_work))
 
 
 async def set_work(guild: discord.Guild, chall_db: Challenge, user: discord.User, value: int):
-    if value == 0:
-        chall_db.working.filter(user=user.id).delete()
-    else:
-        work = chall_db.working.filter(user=user.id).first()
-        if work is None:
-            chall_db.working.create(user=user.id, value=value)
-        elif work.value != value:
-            work.value = value
-        else:
-            return
-    chall_db.save()
-    channel = guild.get_channel(chall_db.channel_id)
-    await update_work_message(chall_db, channel)
+    chall_work = work_buffer.set(chall_db, user.id, value)
+    if chall_work is None:
+        return
+    channel = guild.get_channel(chall_work.channel_id)
+    await update_work_message(chall_work, channel)
 
 
 async def move_work(guild: discord.Guild, ctf_db: Ctf, chall_db: Challenge, user: discord.User):
-    for chall in Challenge.objects(ctf=ctf_db):
-        if chall.id == chall_db.id:
-            continue
-        work = chall.working.filter(user=user.id).first()
-        if work is not None and work.value == 1:
-            await set_work(guild, chall, user, 2)
+    for chall_work in work_buffer.demote(ctf_db, chall_db, user.id):
+        await update_work_message(chall_work, guild.get_channel(chall_work.channel_id))
     await set_work(guild, chall_db, user, 1)
 
 
@@ -128,13 +173,39 @@ class WorkView(ui.View):
         await interaction.response.defer()
 
 
+async def send_challenge_messages(
+    channel: discord.TextChannel,
+    title: str,
+    description: str,
+    send_work_message: bool
+) -> int | None:
+    # Posts the challenge description and the pinned work message, returns its ID
+    chall_title = discord.utils.escape_mentions(title)
+    chall_description = discord.utils.escape_mentions(description)
+    await channel.send(f"# {chall_title}\n\n{chall_description}"[:2000])
+
+    if not send_work_message:
+        return None
+    work_message = await channel.send(view=WorkView())
+    await work_message.pin()
+    return work_message.id
+
+
 @app_commands.command(description="Add a challenge")
 @app_commands.autocomplete(category=category_autocomplete_nullable)
 @app_commands.guild_only
 async def add(interaction: discord.Interaction, category: str, name: str):
     ctf_db = await get_ctf_db(interaction)
+    settings = get_settings(interaction.guild)
 
     if len(interaction.guild.channels) >= MAX_CHANNELS - 3:
+        if settings.auto_free_channels:
+            free_channels_later(interaction.guild, CapacityPlan(interaction.guild).ctf_channels)
+            await interaction.response.send_message(
+                "There are too many channels on this discord server. "
+                "The oldest archived CTFs are being exported and deleted, please try again shortly."
+            )
+            return
         admin_role = get_admin_role(interaction.guild)
         await interaction.response.send_message(
             "There are too many channels on this discord server. "
@@ -147,7 +218,6 @@ async def add(interaction: discord.Interaction, category: str, name: str):
 
     # Check category is valid
     category = sanitize_channel_name(category) if category else None
-    settings = get_settings(interaction.guild)
     if settings.enforce_categories and not category_is_valid(category, interaction.guild_id):
         raise app_commands.AppCommandError("Invalid CTF category")
 
@@ -195,6 +265,7 @@ async def add(interaction: discord.Interaction, category: str, name: str):
                         ephemeral=True
                     )
                     return
+                work_buffer.remove(ctf_db, old_chall.id)
                 old_chall.delete()
 
             new_channel = await create_channel(
@@ -203,16 +274,12 @@ async def add(interaction: discord.Interaction, category: str, name: str):
                 incomplete_category
             )
 
-            chall_title = discord.utils.escape_mentions(self.name_field.value)
-            chall_description = discord.utils.escape_mentions(self.description_field.value)
-
-            await new_channel.send(f"# {chall_title}\n\n{chall_description}")
-
-            work_message_id = None
-            if settings.send_work_message:
-                work_message = await new_channel.send(view=WorkView())
-                await work_message.pin()
-                work_message_id = work_message.id
+            work_message_id = await send_challenge_messages(
+                new_channel,
+                self.name_field.value,
+                self.description_field.value,
+                settings.send_work_message
+            )
 
             chall_db = Challenge(
                 name=name,
@@ -222,20 +289,16 @@ async def add(interaction: discord.Interaction, category: str, name: str):
                 work_message=work_message_id
             )
             chall_db.save()
+            work_buffer.refresh(chall_db)
 
             if category:
-                ctf_category = CtfCategory.objects(
+                # Load the index before incrementing so the new use is only counted once
+                category_index = get_category_index(interaction.guild_id)
+                CtfCategory.objects(
                     name=category,
                     guild_id=interaction.guild_id
-                ).first()
-                if ctf_category is None:
-                    ctf_category = CtfCategory(
-                        name=category,
-                        guild_id=interaction.guild_id,
-                        count=0
-                    )
-                ctf_category.count += 1
-                ctf_category.save()
+                ).update_one(inc__count=1, upsert=True)
+                category_index.increment(category)
 
             await submit_interaction.response.send_message(
                 f"Added challenge {new_channel.mention}"
@@ -245,6 +308,211 @@ async def add(interaction: discord.Interaction, category: str, name: str):
     await interaction.response.send_modal(info)
 
 
+IMPORT_CONCURRENCY = 5
+MAX_IMPORT_SIZE = 1024 * 1024
+
+
+@app_commands.command(
+    name="import",
+    description="Import challenges from a JSON/CSV file or the API of a CTFd instance"
+)
+@app_commands.guild_only
+@app_commands.check(is_team_admin)
+async def import_challenges(
+    interaction: discord.Interaction,
+    file: discord.Attachment | None = None,
+    url: str | None = None,
+    token: str | None = None
+):
+    ctf_db = await get_ctf_db(interaction, allow_chall=False)
+    settings = get_settings(interaction.guild)
+    if (file is None) == (url is None):
+        raise app_commands.AppCommandError("Please supply either a file or a CTFd URL")
+    if file is not None and file.size > MAX_IMPORT_SIZE:
+        raise app_commands.AppCommandError("File is too large")
+
+    await interaction.response.defer(ephemeral=True)
+
+    try:
+        if file is not None:
+            imported = parse_challenge_file(file.filename, await file.read())
+        else:
+            imported = await fetch_challenges(url, token)
+    except (ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise app_commands.AppCommandError(f"Could not read challenges: {e}") from e
+
+    # Skip challenges that already exist or have an invalid category
+    existing = {
+        (chall.category, chall.name)
+        for chall in Challenge.objects(ctf=ctf_db).only("name", "category")
+    }
+    planned = {}
+    skipped = []
+    for chall in imported:
+        name = sanitize_channel_name(chall.name)
+        category = sanitize_channel_name(chall.category) if chall.category else None
+        key = (category or None, name)
+        if not name or key in existing or key in planned or (
+            settings.enforce_categories and not category_is_valid(key[0], interaction.guild_id)
+        ):
+            skipped.append(chall.name)
+            continue
+        planned[key] = chall
+
+    if not planned:
+        await interaction.edit_original_response(content="No new challenges to import")
+        return
+
+    free = CapacityPlan(interaction.guild).free
+    if free < len(planned) and settings.auto_free_channels:
+        free = await free_channels(interaction.guild, len(planned))
+    if free < len(planned):
+        raise app_commands.AppCommandError(
+            f"Not enough free channels, {len(planned)} are needed but only {free} are left"
+        )
+
+    # Create the channels one by one in their final order so every channel lands at the end of
+    # its group, then post the messages concurrently
+    ctf = sanitize_channel_name(ctf_db.name)
+    incomplete_category = get_incomplete_category(interaction.guild)
+    channels = {}
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def send_messages(key: tuple[str | None, str]) -> int | None:
+        async with semaphore:
+            return await send_challenge_messages(
+                channels[key],
+                planned[key].name,
+                planned[key].description,
+                settings.send_work_message
+            )
+
+    try:
+        for key in sorted(planned, key=lambda key: (key[0] or "", key[1])):
+            category, name = key
+            channel_name = f"{ctf}-{category}-{name}" if category else f"{ctf}-{name}"
+            channels[key] = await create_channel(
+                channel_name[:100],
+                interaction.channel.overwrites,
+                incomplete_category
+            )
+
+        # Let every send finish before cleaning up, none may still be posting to a deleted channel
+        work_messages = await asyncio.gather(
+            *(send_messages(key) for key in channels), return_exceptions=True
+        )
+        for result in work_messages:
+            if isinstance(result, Exception):
+                raise result
+    except Exception:
+        # Nothing has been saved yet, remove the channels so no challenge channel is orphaned
+        for channel in channels.values():
+            try:
+                await delete_channel(channel)
+            except discord.HTTPException as e:
+                logging.error("Could not delete channel %s of a failed import: %s", channel.name, e)
+        raise
+
+    challs = [
+        Challenge(
+            name=name,
+            category=category,
+            channel_id=channels[(category, name)].id,
+            ctf=ctf_db,
+            work_message=work_message_id,
+            ctfd_id=planned[(category, name)].ctfd_id
+        )
+        for (category, name), work_message_id in zip(channels, work_messages)
+    ]
+    for chall, chall_id in zip(challs, Challenge.objects.insert(challs, load_bulk=False)):
+        chall.id = chall_id
+        work_buffer.refresh(chall)
+
+    category_counts = Counter(category for category, _ in channels if category)
+    if category_counts:
+        # Load the index before incrementing so the new uses are only counted once
+        category_index = get_category_index(interaction.guild_id)
+        collection = CtfCategory._get_collection()  # pylint: disable=protected-access
+        collection.bulk_write([
+            UpdateOne(
+                {"name": category, "guild_id": interaction.guild_id},
+                {"$inc": {"count": count}},
+                upsert=True
+            )
+            for category, count in category_counts.items()
+        ])
+        for category, count in category_counts.items():
+            category_index.increment(category, count)
+
+    content = f"Imported {len(challs)} challenges"
+    if skipped:
+        content += f"\nSkipped {len(skipped)}: " + ", ".join(skipped)
+    await interaction.edit_original_response(content=content[:2000])
+
+
+async def mark_solved(
+    guild: discord.Guild,
+    ctf_db: Ctf,
+    solves: list[tuple[Challenge, list[int]]]
+):
+    # Moves solved challenges to done and announces them together in the CTF channel.
+    # A challenge is only saved as solved once it has been moved, one that fails stays unsolved
+    # so it is retried, and the first error is raised after the others have been announced.
+    complete_category = get_complete_category(guild)
+
+    # Special emojis for certain users, otherwise default
+    msg_emojis = ("🎉", "🎉")
+    reaction_emoji = "paolo"
+
+    left_emoji, right_emoji = msg_emojis
+
+    lines = []
+    error = None
+    for chall_db, users in solves:
+        channel = guild.get_channel(chall_db.channel_id)
+        if channel is not None:
+            try:
+                await move_channel(channel, complete_category)
+            except (discord.HTTPException, app_commands.AppCommandError) as e:
+                logging.warning("Could not move solved challenge %s: %s", chall_db.name, e)
+                error = error or e
+                continue
+
+        chall_db.solvers = users
+        chall_db.solved = True
+        chall_db.save()
+        work_buffer.refresh(chall_db)
+        work_message_updater.forget(chall_db.work_message)
+
+        if channel is None:
+            continue
+        if users:
+            solvers = " ".join(f"<@!{user}>" for user in users)
+            lines.append(f"{left_emoji}  {channel.mention} was solved by {solvers}!  {right_emoji}")
+        else:
+            lines.append(f"{left_emoji}  {channel.mention} was solved!  {right_emoji}")
+
+    # One message per batch, split at the message length limit
+    messages = []
+    for line in lines:
+        if messages and len(messages[-1]) + len(line) < 2000:
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line[:2000])
+
+    ctf_channel = guild.get_channel(ctf_db.channel_id)
+    emoji = discord.utils.get(guild.emojis, name=reaction_emoji)
+    for msg in messages:
+        sent_msg = await ctf_channel.send(msg)
+
+        # Pre-react to solver message
+        if emoji:
+            await sent_msg.add_reaction(emoji)
+
+    if error is not None:
+        raise error
+
+
 @app_commands.command(description="Marks a challenge as done")
 @app_commands.guild_only
 async def done(interaction: discord.Interaction, contributors: str | None):
@@ -260,27 +528,102 @@ async def done(interaction: discord.Interaction, contributors: str | None):
             if user not in users:
                 users.append(user)
 
-    chall_db.solvers = users
-    chall_db.solved = True
-    chall_db.save()
+    await mark_solved(interaction.guild, ctf_db, [(chall_db, users)])
+    await interaction.response.send_message("Challenge moved to done!")
 
-    await move_channel(interaction.channel, get_complete_category(interaction.guild))
 
-    # Special emojis for certain users, otherwise default
-    msg_emojis = ("🎉", "🎉")
-    reaction_emoji = "paolo"
-    
-    left_emoji, right_emoji = msg_emojis
+SOLVE_POLL_INTERVAL = 30
 
-    solvers = " ".join(f"<@!{user}>" for user in users)
-    msg = f"{left_emoji}  {interaction.channel.mention} was solved by {solvers}!  {right_emoji}"
-    sent_msg = await interaction.guild.get_channel(ctf_db.channel_id).send(msg)
 
-    # Pre-react to solver message
-    emoji = discord.utils.get(interaction.guild.emojis, name=reaction_emoji)
-    await sent_msg.add_reaction(emoji)
+class SolveTracker:
+    # Solves already seen per CTF and the ETag of the last response, so an unchanged
+    # challenge list costs a 304 and unchanged solves cost no database query
+    def __init__(self):
+        self._etags: dict = {}
+        self._seen: dict = {}
+
+    def prune(self, ctf_ids: set):
+        # Forget CTFs that are no longer polled, archived or with their CTFd settings cleared
+        for state in (self._etags, self._seen):
+            for ctf_id in state.keys() - ctf_ids:
+                del state[ctf_id]
+
+    async def poll(self, client: discord.Client, ctf_db: Ctf):
+        ctf_channel = client.get_channel(ctf_db.channel_id)
+        if ctf_channel is None:
+            return
 
-    await interaction.response.send_message("Challenge moved to done!")
+        try:
+            poll = await fetch_solved(
+                ctf_db.ctfd_url,
+                ctf_db.ctfd_token,
+                self._etags.get(ctf_db.id)
+            )
+        except (ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning("Could not read solves of CTF %s from CTFd: %s", ctf_db.name, e)
+            return
+        if poll.etag:
+            self._etags[ctf_db.id] = poll.etag
+        if poll.solved is None:
+            return
+
+        solved_ids = {chall.ctfd_id for chall in poll.solved if chall.ctfd_id is not None}
+        solved_names = {
+            (sanitize_channel_name(chall.category) if chall.category else None,
+             sanitize_channel_name(chall.name))
+            for chall in poll.solved
+        }
+        seen = self._seen.get(ctf_db.id)
+        if seen is not None and solved_ids <= seen[0] and solved_names <= seen[1]:
+            return
+
+        # Challenges imported from a file have no CTFd ID and are matched by name
+        ctf_work = work_buffer.get_ctf(ctf_db)
+        solves = []
+        for chall_db in Challenge.objects(ctf=ctf_db, solved=False):
+            if (chall_db.ctfd_id in solved_ids
+                    or (chall_db.category or None, chall_db.name) in solved_names):
+                # Credit whoever is working on it
+                chall_work = ctf_work.challenges.get(chall_db.id)
+                users = [
+                    user for user, value in chall_work.users.items() if value == 1
+                ] if chall_work else []
+                solves.append((chall_db, users))
+
+        if solves:
+            try:
+                await mark_solved(ctf_channel.guild, ctf_db, solves)
+            except (discord.HTTPException, app_commands.AppCommandError) as e:
+                logging.warning("Could not mark solves of CTF %s as done: %s", ctf_db.name, e)
+                return
+        self._seen[ctf_db.id] = (solved_ids, solved_names)
+
+
+solve_tracker = SolveTracker()
+
+
+@tasks.loop(seconds=SOLVE_POLL_INTERVAL)
+async def poll_solves(client: discord.Client):
+    # One loop for every running CTF that reads its solves from CTFd.
+    # Errors are logged per CTF, an exception escaping the loop would stop it for all CTFs.
+    try:
+        ctfs = list(Ctf.objects(archived=False, ctfd_url__ne=None))
+    except PyMongoError as e:
+        logging.error("Could not load CTFs to poll for solves: %s", e)
+        return
+    solve_tracker.prune({ctf_db.id for ctf_db in ctfs})
+    results = await asyncio.gather(
+        *(solve_tracker.poll(client, ctf_db) for ctf_db in ctfs),
+        return_exceptions=True
+    )
+    for ctf_db, result in zip(ctfs, results):
+        if isinstance(result, Exception):
+            logging.error(
+                "Could not poll solves of CTF %s: %s",
+                ctf_db.name,
+                result,
+                exc_info=result
+            )
 
 
 @app_commands.command(description="Marks a challenge as undone")
@@ -295,6 +638,7 @@ async def undone(interaction: discord.Interaction):
     chall_db.solvers = []
     chall_db.solved = False
     chall_db.save()
+    work_buffer.refresh(chall_db)
 
     await move_channel(interaction.channel, get_incomplete_category(interaction.guild))
     await interaction.response.send_message("Reopened challenge as not done")
@@ -309,6 +653,7 @@ class CategoryCommands(app_commands.Group):
         try:
             ctf_category = CtfCategory(name=category, guild_id=interaction.guild_id, count=5)
             ctf_category.save()
+            get_category_index(interaction.guild_id).add(category, ctf_category.count)
         except NotUniqueError:
             await interaction.response.send_message("CTF category already exists", ephemeral=True)
         else:
@@ -327,6 +672,7 @@ class CategoryCommands(app_commands.Group):
             await interaction.response.send_message("Unknown CTF category", ephemeral=True)
         else:
             ctf_category.delete()
+            get_category_index(interaction.guild_id).remove(category)
             await interaction.response.send_message("Deleted CTF category", ephemeral=True)
 
 
@@ -349,18 +695,25 @@ WORK_VALUES = [WorkValue(0, 0xffffff, "None"),
 CELL_HEIGHT = 35 / 77
 CELL_WIDTH = 100 / 77
 MAX_TABLE_USERS = 20
+FAST_TABLE_CELLS = 500
+
+def new_figure(figsize: tuple[float, float]) -> Figure:
+    # Figures are not registered with pyplot, so the renderers can run in a worker thread
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
 
-def export_table(solves: dict[discord.Member, list[int]], challs: list[str], filename: str):
-    has_names = len(solves) <= MAX_TABLE_USERS
+def export_table(work: np.ndarray, challs: list[str], users: list[str], filename: str):
+    has_names = len(users) <= MAX_TABLE_USERS
     height = len(challs)
-    width = len(solves)
+    width = len(users)
 
-    fig, ax = plt.subplots(
-        figsize=(
-            width * (CELL_WIDTH if has_names else CELL_HEIGHT),
-            height * CELL_HEIGHT
-        )
-    )
+    fig = new_figure((
+        width * (CELL_WIDTH if has_names else CELL_HEIGHT),
+        height * CELL_HEIGHT
+    ))
+    ax = fig.subplots()
     ax.axis("off")
     tbl = Table(ax, loc="center")
 
@@ -379,18 +732,49 @@ def export_table(solves: dict[discord.Member, list[int]], challs: list[str], fil
     for row, name in enumerate(challs):
         add_cell(row + 1, 0, text=name, loc="left")
 
-    for col, user in enumerate(solves.keys()):
-        nm = user.nick if hasattr(user, "nick") and user.nick else user.name
-        add_cell(0, col + 1, text=nm if has_names else None, edges="B", color="black")
+    for col, user in enumerate(users):
+        add_cell(0, col + 1, text=user if has_names else None, edges="B", color="black")
         if has_names:
             tbl[0, col + 1].auto_set_font_size(fig.canvas.get_renderer())
-        for row, val in enumerate(solves[user]):
+        for row, val in enumerate(work[:, col]):
             color = WORK_VALUES[val].hex_color() if 0 <= val < len(WORK_VALUES) else "w"
             add_cell(row + 1, col + 1, color=color)
     tbl.auto_set_column_width(0)
     tbl.auto_set_font_size(False)
     ax.add_table(tbl)
-    plt.savefig(filename, bbox_inches="tight", pad_inches=0)
+    fig.savefig(filename, bbox_inches="tight", pad_inches=0)
+
+
+def export_table_fast(work: np.ndarray, challs: list[str], users: list[str], filename: str):
+    # Same layout as export_table drawn as a single image, for tables with many cells
+    has_names = len(users) <= MAX_TABLE_USERS
+    height, width = work.shape
+
+    fig = new_figure((
+        width * (CELL_WIDTH if has_names else CELL_HEIGHT),
+        height * CELL_HEIGHT
+    ))
+    ax = fig.subplots()
+    # Unknown work values are white like in export_table
+    colors = [work_value.hex_color() for work_value in WORK_VALUES] + ["w"]
+    ax.imshow(
+        np.minimum(work, len(WORK_VALUES)),
+        cmap=ListedColormap(colors),
+        vmin=0,
+        vmax=len(colors) - 1,
+        aspect="auto",
+        interpolation="nearest"
+    )
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.tick_params(length=0)
+    ax.set_yticks(range(height), challs)
+    if has_names:
+        ax.xaxis.tick_top()
+        ax.set_xticks(range(width), users, rotation=90)
+    else:
+        ax.set_xticks([])
+    fig.savefig(filename, bbox_inches="tight", pad_inches=0)
 
 
 @app_commands.command(description="Shortcut to set working status on the challenge")
@@ -420,7 +804,7 @@ class WorkingCommands(app_commands.Group):
     @app_commands.guild_only
     async def get(self, interaction: discord.Interaction):
         chall_db, _ = await check_challenge(interaction)
-        embeds = get_work_embeds(chall_db)
+        embeds = get_work_embeds(work_buffer.get(chall_db))
         await interaction.response.send_message(
             "" if embeds else "Nobody is working on this",
             embeds=embeds,
@@ -436,43 +820,45 @@ class WorkingCommands(app_commands.Group):
         assert isinstance(interaction.channel, discord.TextChannel)
 
         await interaction.response.defer(ephemeral=True)
-        if include_solved:
-            challs = Challenge.objects(ctf=ctf_db)
-        else:
-            challs = Challenge.objects(ctf=ctf_db, solved=False)
-        sorted_challs = sorted(challs, key=lambda x: (x.category or "", x.name))
+        ctf_work = work_buffer.get_ctf(ctf_db)
 
         # Filter out deleted challs
         challs = []
-        for chall in sorted_challs:
-            if interaction.guild.get_channel(chall.channel_id):
+        for chall in list(ctf_work.challenges.values()):
+            if not interaction.guild.get_channel(chall.channel_id):
+                Challenge.objects(id=chall.id).delete()
+                work_buffer.remove(ctf_db, chall.id)
+                work_message_updater.forget(chall.work_message)
+            elif include_solved or not chall.solved:
                 challs.append(chall)
-            else:
-                chall.delete()
-
-        # Create table of users who have done work
-        tbl = {}
-        for i, chall in enumerate(challs):
-            for work in chall.working:
-                user = interaction.guild.get_member(work.user)
-                if user not in tbl:
-                    tbl[user] = [0] * len(challs)
-                tbl[user][i] = work.value
-
-        if not tbl:
+        challs.sort(key=lambda x: (x.category or "", x.name))
+
+        # Table of users who have done work
+        work, user_ids = ctf_work.table(challs)
+        if not user_ids:
             await interaction.edit_original_response(
                 content="No work has been done on any challenges yet"
             )
             return
 
+        users = []
+        for user_id in user_ids:
+            user = interaction.guild.get_member(user_id)
+            users.append((user.nick or user.name) if user else str(user_id))
+
         with tempfile.TemporaryDirectory() as tmp:
             filename = Path(tmp) / "overview.png"
-            export_table(
-                tbl,
+            render = export_table_fast if work.size > FAST_TABLE_CELLS else export_table
+            # Rendering takes long enough to stall the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                render,
+                work,
                 [
                     (chall.category + "-" if chall.category else "") + chall.name
                     for chall in challs
                 ],
+                users,
                 filename
             )
             await interaction.edit_original_response(attachments=[discord.File(filename)])
@@ -480,6 +866,7 @@ class WorkingCommands(app_commands.Group):
 
 def add_commands(tree: app_commands.CommandTree, guild: discord.Object | None):
     tree.add_command(add, guild=guild)
+    tree.add_command(import_challenges, guild=guild)
     tree.add_command(done, guild=guild)
     tree.add_command(undone, guild=guild)
     tree.add_command(w, guild=guild)
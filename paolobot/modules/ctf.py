@@ -1,4 +1,6 @@
+import asyncio
 import json
+import logging
 import re
 
 from pathlib import Path
@@ -9,6 +11,11 @@ from dateutil import parser
 from discord import app_commands
 from discord import ui
 
+from paolobot.autocomplete import get_ctf_index
+from paolobot.capacity import CapacityPlan
+from paolobot.invites import add_invite, remove_ctf_invites, rename_ctf_invites, load_invites
+from paolobot.metrics import spawn_background
+from paolobot.roles import role_queue, report_progress
 from paolobot.utils import (
     is_team_admin,
     create_channel,
@@ -27,6 +34,7 @@ from paolobot.utils import (
     MAX_CHANNELS
 )
 from paolobot.modules.ctftime import Ctftime
+from paolobot.work_state import work_buffer
 from paolobot.config import config
 
 from paolobot.models.challenge import Challenge
@@ -52,6 +60,56 @@ async def get_ctf_db(
     return ctf_db
 
 
+def get_ctf_channels(guild: discord.Guild, ctf_db: Ctf) -> list[discord.TextChannel]:
+    channel_ids = [ctf_db.channel_id]
+    channel_ids += [chall.channel_id for chall in Challenge.objects(ctf=ctf_db).only("channel_id")]
+    return [channel for channel in map(guild.get_channel, channel_ids) if channel]
+
+
+async def set_member_access(
+    guild: discord.Guild,
+    ctf_db: Ctf,
+    member: discord.Member,
+    allowed: bool,
+    reason: str
+):
+    overwrite = None if allowed else discord.PermissionOverwrite(view_channel=False)
+    for channel in get_ctf_channels(guild, ctf_db):
+        await channel.set_permissions(member, overwrite=overwrite, reason=reason)
+
+
+async def join_ctf(guild: discord.Guild, ctf_db: Ctf, member: discord.Member, reason: str):
+    if ctf_db.team_access and get_team_role(guild) in member.roles:
+        # Team members already have access unless they left
+        if member.id in ctf_db.left_members:
+            ctf_db.update(pull__left_members=member.id)
+            ctf_db.left_members.remove(member.id)
+            await set_member_access(guild, ctf_db, member, True, reason)
+        return
+    role_queue.add(member, guild.get_role(ctf_db.role_id), reason=reason)
+
+
+async def leave_ctf(
+    guild: discord.Guild,
+    ctf_db: Ctf,
+    member: discord.Member,
+    reason: str
+) -> bool:
+    left = False
+    ctf_role = guild.get_role(ctf_db.role_id)
+    if ctf_role in member.roles:
+        role_queue.remove(member, ctf_role, reason=reason)
+        left = True
+
+    if (ctf_db.team_access and get_team_role(guild) in member.roles
+            and member.id not in ctf_db.left_members):
+        ctf_db.update(add_to_set__left_members=member.id)
+        ctf_db.left_members.append(member.id)
+        await set_member_access(guild, ctf_db, member, False, reason)
+        left = True
+    return left
+
+
 def user_to_dict(user: discord.Member | discord.User):
     return {
         "id": user.id,
@@ -112,6 +170,104 @@ async def export_channels(channels: list[discord.TextChannel]):
     return ctf_export
 
 
+async def export_ctf(guild: discord.Guild, ctf_db: Ctf) -> Path | None:
+    channels = []
+    if ctf_channel := guild.get_channel(ctf_db.channel_id):
+        channels.append(ctf_channel)
+
+    for chall in Challenge.objects(ctf=ctf_db):
+        channel = guild.get_channel(chall.channel_id)
+        if channel:
+            channels.append(channel)
+        else:
+            work_buffer.remove(ctf_db, chall.id)
+            chall.delete()
+
+    ctf_export = await export_channels(channels)
+
+    export_dir = Path(config.backups_dir) / str(guild.id)
+    export_dir.mkdir(exist_ok=True)
+
+    filepath = export_dir / f"{ctf_db.channel_id}_{ctf_db.name}.json"
+    try:
+        with open(filepath, "w", encoding="utf8") as f:
+            f.write(json.dumps(ctf_export, separators=(",", ":")))
+    except FileNotFoundError:
+        # Export dir was not created
+        return None
+
+    export_channel = get_export_channel(guild)
+    await export_channel.send(files=[discord.File(filepath, filename=f"{ctf_db.name}.json")])
+    return filepath
+
+
+async def delete_ctf(guild: discord.Guild, ctf_db: Ctf) -> discord.TextChannel | None:
+    for chall in Challenge.objects(ctf=ctf_db):
+        try:
+            await delete_channel(guild.get_channel(chall.channel_id))
+        except AttributeError:
+            pass
+
+    try:
+        await guild.get_role(ctf_db.role_id).delete(reason="Deleted CTF channels")
+    except AttributeError:
+        pass
+
+    ctf_channel = guild.get_channel(ctf_db.channel_id)
+    try:
+        await delete_channel(ctf_channel)
+    except AttributeError:
+        pass
+
+    Challenge.objects(ctf=ctf_db).delete()
+
+    # Delete any invites for the CTF
+    invite_channel = get_invite_channel(guild)
+    for invite in Invite.objects(ctf=ctf_db):
+        await invite_channel.get_partial_message(invite.message_id).delete()
+
+    Invite.objects(ctf=ctf_db).delete()
+    remove_ctf_invites(ctf_db)
+
+    get_ctf_index().remove(ctf_db.name)
+    work_buffer.drop_ctf(ctf_db)
+    ctf_db.delete()
+    return ctf_channel
+
+
+_free_channel_locks: dict[int, asyncio.Lock] = {}
+
+
+async def free_channels(guild: discord.Guild, needed: int) -> int:
+    # Export and delete the oldest archived CTFs until enough channels are free
+    async with _free_channel_locks.setdefault(guild.id, asyncio.Lock()):
+        plan = CapacityPlan(guild)
+        free = plan.free
+        for ctf_usage in plan.reclaimable(needed):
+            # A CTF that fails is skipped, the command that needs the room continues regardless
+            try:
+                if await export_ctf(guild, ctf_usage.ctf) is None:
+                    logging.warning("Could not export CTF %s, not deleting it", ctf_usage.ctf.name)
+                    break
+            except (discord.HTTPException, OSError) as e:
+                logging.error("Could not export CTF %s, not deleting it: %s", ctf_usage.ctf.name, e)
+                continue
+            try:
+                await delete_ctf(guild, ctf_usage.ctf)
+            except (discord.HTTPException, OSError) as e:
+                logging.error("Could not delete archived CTF %s: %s", ctf_usage.ctf.name, e)
+                continue
+            logging.info("Deleted archived CTF %s to free %d channels",
+                         ctf_usage.ctf.name, ctf_usage.channels)
+            free += ctf_usage.channels
+        return free
+
+
+def free_channels_later(guild: discord.Guild, needed: int):
+    # Not accounted to the command that ran out of channels
+    spawn_background(free_channels(guild, needed))
+
+
 def create_info_message(info):
     msg = f"## {discord.utils.escape_mentions(info['title'])}"
 
@@ -139,11 +295,10 @@ async def ctf_autocomplete(
     interaction: discord.Interaction,
     current: str
 ) -> list[app_commands.Choice[str]]:
-    query = Ctf.objects(
-        name=re.compile("^" + re.escape(current)),
-        archived=False
-    ).order_by("name")[:25]
-    return [app_commands.Choice(name=c["name"], value=c["name"]) for c in query]
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in get_ctf_index().search(current)
+    ]
 
 
 class CtfCommands(app_commands.Group):
@@ -157,12 +312,22 @@ class CtfCommands(app_commands.Group):
         ctftime: str | None,
         private: bool = False
     ):
-        if len(interaction.guild.channels) >= MAX_CHANNELS - 3:
+        settings = get_settings(interaction.guild)
+        if len(interaction.guild.channels) >= MAX_CHANNELS - 3 and not settings.auto_free_channels:
             raise app_commands.AppCommandError("There are too many channels on this discord server")
         name = sanitize_channel_name(name)
 
         await interaction.response.defer(ephemeral=True)
 
+        # Make room for the new CTF and for the running CTFs to grow
+        plan = CapacityPlan(interaction.guild)
+        needed = plan.ctf_channels + plan.expected_growth + 1
+        free = plan.free
+        if free < needed and settings.auto_free_channels:
+            free = await free_channels(interaction.guild, needed)
+        if free < 1:
+            raise app_commands.AppCommandError("There are too many channels on this discord server")
+
         if existing_ctf := Ctf.objects(name=name).first():
             if interaction.guild.get_channel(existing_ctf.channel_id):
                 await interaction.edit_original_response(
@@ -174,6 +339,7 @@ class CtfCommands(app_commands.Group):
             # Remove all challenges that have no corresponding channel
             for chall in Challenge.objects(ctf=existing_ctf):
                 if not interaction.guild.get_channel(chall.channel_id):
+                    work_buffer.remove(existing_ctf, chall.id)
                     chall.delete()
 
             # Check if any channels remain
@@ -192,16 +358,17 @@ class CtfCommands(app_commands.Group):
                 )
             except AttributeError:
                 pass
+            get_ctf_index().remove(existing_ctf.name)
+            work_buffer.drop_ctf(existing_ctf)
             existing_ctf.delete()
 
-        settings = get_settings(interaction.guild)
-
         new_role = await interaction.guild.create_role(name=name + "-team")
         overwrites = {
             interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
             new_role: discord.PermissionOverwrite(view_channel=True)
         }
-        if not private and settings.use_team_role_as_acl:
+        team_access = not private and settings.team_overwrite_access
+        if not private and (settings.use_team_role_as_acl or team_access):
             team_role = get_team_role(interaction.guild)
             overwrites[team_role] = discord.PermissionOverwrite(view_channel=True)
         if private:
@@ -228,16 +395,28 @@ class CtfCommands(app_commands.Group):
             role_id=new_role.id,
             info=info,
             info_id=info_msg.id,
-            private=private
+            private=private,
+            team_access=team_access
         )
         ctf_db.save()
+        get_ctf_index().add(name)
 
         await interaction.delete_original_response()
-        await interaction.channel.send(f"Created CTF {new_channel.mention}")
+        content = f"Created CTF {new_channel.mention}"
+        if free < needed:
+            content += (
+                f"\n**Warning:** Only {free} channels are left, running CTFs are expected "
+                f"to need {needed}. See `/ctf capacity`"
+            )
+        created_msg = await interaction.channel.send(content)
 
-        if not private and not settings.use_team_role_as_acl:
-            for member in get_team_role(interaction.guild).members:
-                await member.add_roles(new_role)
+        if not private and not settings.use_team_role_as_acl and not team_access:
+            job = role_queue.add_many(
+                get_team_role(interaction.guild).members,
+                new_role,
+                reason=f"Joined CTF {name}"
+            )
+            report_progress(job, created_msg, content)
 
 
     @app_commands.command(description="Update CTF information")
@@ -357,6 +536,7 @@ class CtfCommands(app_commands.Group):
             if channel:
                 await move_channel(channel, get_archive_category(interaction.guild))
             else:
+                work_buffer.remove(ctf_db, chall.id)
                 chall.delete()
 
         await move_channel(
@@ -366,6 +546,10 @@ class CtfCommands(app_commands.Group):
         )
         ctf_db.archived = True
         ctf_db.save()
+        get_ctf_index().remove(ctf_db.name)
+        # Write out pending work before unloading, an unarchive loads it again from the DB
+        work_buffer.flush()
+        work_buffer.drop_ctf(ctf_db)
         await interaction.edit_original_response(content="The CTF has been archived")
 
     @app_commands.command(description="Unarchive a CTF")
@@ -386,6 +570,7 @@ class CtfCommands(app_commands.Group):
             if channel:
                 await move_channel(channel, target_category)
             else:
+                work_buffer.remove(ctf_db, chall.id)
                 chall.delete()
 
         await move_channel(
@@ -395,6 +580,7 @@ class CtfCommands(app_commands.Group):
         )
         ctf_db.archived = False
         ctf_db.save()
+        get_ctf_index().add(ctf_db.name)
         await interaction.edit_original_response(content="The CTF has been unarchived")
 
     @app_commands.command(description="Rename a CTF and its channels")
@@ -410,8 +596,11 @@ class CtfCommands(app_commands.Group):
 
         if ctf_db.info.get("title") == ctf_db.name:
             ctf_db.info["title"] = name
+        get_ctf_index().remove(ctf_db.name)
         ctf_db.name = name
         ctf_db.save()
+        get_ctf_index().add(name)
+        rename_ctf_invites(ctf_db)
 
         await interaction.channel.edit(name=name)
 
@@ -423,6 +612,7 @@ class CtfCommands(app_commands.Group):
                 else:
                     await channel.edit(name=f"{name}-{chall.name}")
             else:
+                work_buffer.remove(ctf_db, chall.id)
                 chall.delete()
         await interaction.edit_original_response(content="The CTF has been renamed")
 
@@ -435,33 +625,11 @@ class CtfCommands(app_commands.Group):
 
         await interaction.response.defer()
 
-        channels = [interaction.channel]
-
-        for chall in Challenge.objects(ctf=ctf_db):
-            channel = interaction.guild.get_channel(chall.channel_id)
-            if channel:
-                channels.append(channel)
-            else:
-                chall.delete()
-
-        ctf_export = await export_channels(channels)
-
-        export_dir = Path(config.backups_dir) / str(interaction.guild_id)
-        export_dir.mkdir(exist_ok=True)
-
-        filepath = export_dir / f"{interaction.channel_id}_{ctf_db.name}.json"
-        try:
-            with open(filepath, "w", encoding="utf8") as f:
-                f.write(json.dumps(ctf_export, separators=(",", ":")))
-        except FileNotFoundError:
-            # Export dir was not created
+        if await export_ctf(interaction.guild, ctf_db) is None:
             await interaction.edit_original_response(
                 content="Invalid file permissions when exporting CTF"
             )
             return
-
-        export_channel = get_export_channel(interaction.guild)
-        await export_channel.send(files=[discord.File(filepath, filename=f"{ctf_db.name}.json")])
         await interaction.edit_original_response(content="The CTF has been exported")
 
     @app_commands.command(description="Delete a CTF and its channels")
@@ -491,39 +659,107 @@ class CtfCommands(app_commands.Group):
 
         await interaction.response.defer()
 
-        for chall in Challenge.objects(ctf=ctf_db):
-            try:
-                await delete_channel(interaction.guild.get_channel(chall.channel_id))
-            except AttributeError:
-                pass
-
-        try:
-            await interaction.guild.get_role(ctf_db.role_id).delete(reason="Deleted CTF channels")
-        except AttributeError:
-            pass
+        ctf_channel = await delete_ctf(interaction.guild, ctf_db)
 
-        ctf_channel = interaction.guild.get_channel(ctf_db.channel_id)
-        try:
-            await delete_channel(ctf_channel)
-        except AttributeError:
-            pass
+        if interaction.channel != ctf_channel:
+            await interaction.edit_original_response(
+                content="CTF deleted successfully"
+            )
 
-        Challenge.objects(ctf=ctf_db).delete()
+    @app_commands.command(description="Mark challenges done when CTFd reports them solved")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def ctfd(
+        self,
+        interaction: discord.Interaction,
+        url: str | None = None,
+        token: str | None = None
+    ):
+        ctf_db = await get_ctf_db(interaction, allow_chall=False)
 
-        # Delete any invites for the CTF
-        invite_channel = get_invite_channel(interaction.guild)
-        for invite in Invite.objects(ctf=ctf_db):
-            await invite_channel.get_partial_message(invite.message_id).delete()
+        if url is None:
+            ctf_db.ctfd_url = None
+            ctf_db.ctfd_token = None
+            ctf_db.save()
+            await interaction.response.send_message(
+                "Stopped reading solves from CTFd",
+                ephemeral=True
+            )
+            return
 
-        Invite.objects(ctf=ctf_db).delete()
+        if not re.match(r"^https?://", url):
+            raise app_commands.AppCommandError("The CTFd URL must start with http:// or https://")
+        if not token:
+            raise app_commands.AppCommandError("A CTFd access token of the team account is needed")
 
-        ctf_db.delete()
+        ctf_db.ctfd_url = url
+        ctf_db.ctfd_token = token
+        ctf_db.save()
+        await interaction.response.send_message("Reading solves from CTFd", ephemeral=True)
 
-        if interaction.channel != ctf_channel:
-            await interaction.edit_original_response(
-                content="CTF deleted successfully"
+    @app_commands.command(description="Show channel usage and projections")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def capacity(self, interaction: discord.Interaction):
+        plan = CapacityPlan(interaction.guild)
+        out = str(plan)
+        reclaimable = plan.reclaimable(plan.expected_growth + plan.ctf_channels)
+        if reclaimable:
+            names = ", ".join(ctf_usage.ctf.name for ctf_usage in reclaimable)
+            out += f"\nOldest archived CTFs to export and delete for room: {names}"
+        await interaction.response.send_message(out, ephemeral=True)
+
+    @app_commands.command(description="Give team members access to public CTFs through overwrites")
+    @app_commands.guild_only
+    @app_commands.check(is_team_admin)
+    async def migrate(self, interaction: discord.Interaction):
+        settings = get_settings(interaction.guild)
+        if not settings.team_overwrite_access:
+            raise app_commands.AppCommandError(
+                "Enable team_overwrite_access with /bot set before migrating"
             )
 
+        await interaction.response.defer(ephemeral=True)
+
+        team_role = get_team_role(interaction.guild)
+        migrated = 0
+        for ctf_db in Ctf.objects(private=False, team_access__ne=True):
+            ctf_channel = interaction.guild.get_channel(ctf_db.channel_id)
+            if ctf_channel is None:
+                continue
+
+            # CTFs created with use_team_role_as_acl never gave out per-member roles
+            role_based = team_role not in ctf_channel.overwrites
+
+            ctf_role = interaction.guild.get_role(ctf_db.role_id)
+            left_members = []
+            if role_based and ctf_role is not None:
+                # Team members without the CTF role have left the CTF
+                for member in team_role.members:
+                    if ctf_role in member.roles:
+                        role_queue.remove(member, ctf_role, reason="Migrated CTF access")
+                    else:
+                        left_members.append(member)
+                        ctf_db.left_members.append(member.id)
+
+            # All overwrites of a channel in one edit instead of one call per member
+            for channel in get_ctf_channels(interaction.guild, ctf_db):
+                overwrites = channel.overwrites
+                overwrites[team_role] = discord.PermissionOverwrite(view_channel=True)
+                for member in left_members:
+                    overwrites[member] = discord.PermissionOverwrite(view_channel=False)
+                await channel.edit(
+                    overwrites=overwrites,
+                    reason="Migrated CTF to team overwrite access"
+                )
+
+            ctf_db.team_access = True
+            ctf_db.save()
+            migrated += 1
+
+        load_invites()
+        await interaction.edit_original_response(content=f"Migrated {migrated} CTFs")
+
     @app_commands.command(description="Generate an invitation for a CTF")
     @app_commands.autocomplete(ctf=ctf_autocomplete)
     @app_commands.guild_only
@@ -550,6 +786,7 @@ class CtfCommands(app_commands.Group):
             ctf=ctf_object
         )
         invite.save()
+        add_invite(invite_msg.id, emoji, ctf_object)
 
         await invite_msg.add_reaction(reaction)
         await interaction.response.send_message(f"Invite generated for {ctf}")
@@ -561,11 +798,9 @@ async def invite(interaction: discord.Interaction, user: discord.Member):
     ctf_db = await get_ctf_db(interaction)
     assert isinstance(interaction.channel, discord.TextChannel)
 
-    await user.add_roles(
-        interaction.guild.get_role(ctf_db.role_id),
-        reason=f"Invited by {interaction.user.name}"
-    )
-    await interaction.response.send_message(f"Invited user {user.mention}")
+    await interaction.response.defer()
+    await join_ctf(interaction.guild, ctf_db, user, f"Invited by {interaction.user.name}")
+    await interaction.edit_original_response(content=f"Invited user {user.mention}")
 
 
 @app_commands.command(description="Leave a CTF")
@@ -574,12 +809,12 @@ async def leave(interaction: discord.Interaction):
     ctf_db = await get_ctf_db(interaction)
     assert isinstance(interaction.channel, discord.TextChannel)
 
-    ctf_role = interaction.guild.get_role(ctf_db.role_id)
-    if ctf_role in interaction.user.roles:
-        await interaction.user.remove_roles(ctf_role, reason="Left CTF")
-        await interaction.response.send_message(f"{interaction.user.mention} Left the CTF")
+    await interaction.response.defer(ephemeral=True)
+    if await leave_ctf(interaction.guild, ctf_db, interaction.user, "Left CTF"):
+        await interaction.delete_original_response()
+        await interaction.channel.send(f"{interaction.user.mention} Left the CTF")
     else:
-        await interaction.response.send_message("Cannot leave CTF", ephemeral=True)
+        await interaction.edit_original_response(content="Cannot leave CTF")
 
 
 @app_commands.command(description="Remove a user from the CTF")
@@ -589,12 +824,12 @@ async def remove(interaction: discord.Interaction, user: discord.Member):
     ctf_db = await get_ctf_db(interaction)
     assert isinstance(interaction.channel, discord.TextChannel)
 
-    ctf_role = interaction.guild.get_role(ctf_db.role_id)
-    if ctf_role in user.roles:
-        await user.remove_roles(ctf_role, reason=f"Removed by {interaction.user.name}")
-        await interaction.response.send_message(f"Removed user {user.mention}")
+    await interaction.response.defer(ephemeral=True)
+    if await leave_ctf(interaction.guild, ctf_db, user, f"Removed by {interaction.user.name}"):
+        await interaction.delete_original_response()
+        await interaction.channel.send(f"Removed user {user.mention}")
     else:
-        await interaction.response.send_message("Cannot remove user from CTF", ephemeral=True)
+        await interaction.edit_original_response(content="Cannot remove user from CTF")
 
 
 def add_commands(tree: app_commands.CommandTree, guild: discord.Object | None):
@@ -1,7 +1,9 @@
+import re
+import time
+
 from datetime import datetime
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlparse, parse_qs
 
-import aiohttp
 import discord
 
 from bs4 import BeautifulSoup
@@ -9,24 +11,62 @@ from dateutil import parser
 from discord import app_commands
 from tabulate import tabulate
 
+from paolobot.models.ctftime_team import CtftimeTeam
+from paolobot.scheduler import RequestScheduler, PRIORITY_INTERACTIVE
 from paolobot.utils import get_settings
 
+ctftime_scheduler = RequestScheduler("ctftime", rate=1.0, burst=5)
+
+TEAM_URL_REGEX = re.compile(r"^https?://ctftime\.org/team/(\d+)/?$")
+
+RATING_TOP_EVENTS = 10
+RATING_CACHE_TTL = 15 * 60
+MAX_CALC_SCENARIOS = 20
+
+
+def rating_points(weight: float, best_points: float, team_points: float, team_place: int) -> float:
+    return (team_points/best_points + 1/team_place) * weight
+
+
+class TeamRating:
+    def __init__(self, team_name: str, events: list[list], total: float):
+        self.team_name = team_name
+        self.events = events
+        self.total = total
+        self.points = [float(row[3].replace("*", "")) for row in events]
+        self.fetched = time.monotonic()
+
+    @property
+    def cutoff(self) -> float:
+        # Score a new event has to beat to enter the top events
+        if len(self.points) < RATING_TOP_EVENTS:
+            return 0.0
+        return min(self.points)
+
+    def what_if(self, score: float) -> float:
+        return self.total + max(score - self.cutoff, 0)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.fetched < RATING_CACHE_TTL
+
+
+_team_ratings: dict[tuple[str, int], TeamRating] = {}
+
 
 class Ctftime(app_commands.Group):
 
     @staticmethod
     async def get_ctf_info(event_id):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://ctftime.org/api/v1/events/{event_id}/") as response:
-                if response.status != 200:
-                    return None
-                data = await response.json()
-                return {
-                    "title": data["title"],
-                    "url": data["url"],
-                    "start": int(parser.parse(data["start"]).timestamp()),
-                    "end": int(parser.parse(data["finish"]).timestamp()),
-                }
+        response = await ctftime_scheduler.fetch(f"https://ctftime.org/api/v1/events/{event_id}/")
+        if response.status != 200:
+            return None
+        data = response.json()
+        return {
+            "title": data["title"],
+            "url": data["url"],
+            "start": int(parser.parse(data["start"]).timestamp()),
+            "end": int(parser.parse(data["finish"]).timestamp()),
+        }
 
     @staticmethod
     def get_table_from_html(tbl, raw=False):
@@ -67,49 +107,95 @@ class Ctftime(app_commands.Group):
                 return None
 
             settings = get_settings(interaction.guild)
+            if settings.ctftime_team_id:
+                return f"https://ctftime.org/team/{settings.ctftime_team_id}"
             if not settings.ctftime_team:
                 return None
             team = settings.ctftime_team
 
-        if team.isnumeric():
-            return f"https://ctftime.org/team/{int(team)}"
+        team_id = Ctftime.get_cached_team_id(team)
+        if team_id is not None:
+            return f"https://ctftime.org/team/{team_id}"
         return f"https://ctftime.org/team/list/?q={quote_plus(team)}"
 
+    @staticmethod
+    def get_cached_team_id(team: str) -> int | None:
+        if team.isnumeric():
+            return int(team)
+        cached = CtftimeTeam.objects(name=team.lower()).first()
+        return cached.team_id if cached else None
+
+    @staticmethod
+    def cache_team_id(team: str, response_url: str) -> int | None:
+        # Team searches with a single match are redirected to the team page
+        regex_team = TEAM_URL_REGEX.search(response_url)
+        if regex_team is None:
+            return None
+        team_id = int(regex_team.group(1))
+        CtftimeTeam.objects(name=team.lower()).update_one(set__team_id=team_id, upsert=True)
+        return team_id
+
+    @staticmethod
+    async def resolve_team_id(team: str, priority: int = PRIORITY_INTERACTIVE) -> int | None:
+        team_id = Ctftime.get_cached_team_id(team)
+        if team_id is not None:
+            return team_id
+
+        response = await ctftime_scheduler.fetch(
+            f"https://ctftime.org/team/list/?q={quote_plus(team)}",
+            priority=priority
+        )
+        if response.status != 200:
+            return None
+        return Ctftime.cache_team_id(team, response.url)
+
     @staticmethod
     async def get_team_top10(team_url, year):
-        async with aiohttp.ClientSession() as session, session.get(team_url) as response:
-            if response.status != 200:
-                raise app_commands.AppCommandError("Unknown team or server error")
-
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-            team_name = soup.find(class_="page-header").text.strip()
-
-            year_rating = soup.find(id=f"rating_{year}")
-            if year_rating is None:
-                raise app_commands.AppCommandError("Invalid year for this team")
-            _, tbl = Ctftime.get_table_from_html(year_rating.find("table"))
-
-            h3_tag = soup.find("h3", text="Organized CTF events")
-            organized_tag = h3_tag.find_next_sibling("table") if h3_tag else None
-
-            if organized_tag:
-                _, organized_tbl = Ctftime.get_table_from_html(organized_tag, raw=True)
-                for name, weight in organized_tbl:
-                    event_id = name["href"].split("/")[-1]
-
-                    async with session.get(
-                        f"https://ctftime.org/api/v1/events/{event_id}/"
-                    ) as response:
-                        if response.status != 200:
-                            break
-                        resp = await response.json()
-                        if int(resp["finish"][:4]) != year:
-                            break
-                    tbl.append(["-", name.text, "-", str(float(weight.text)*2)])
-            tbl = sorted(tbl, key=lambda row: -float(row[3].replace("*","")))[:10]
-            s = sum(float(row[3].replace("*","")) for row in tbl)
-            return team_name, tbl, s
+        response = await ctftime_scheduler.fetch(team_url)
+        if response.status == 429:
+            raise app_commands.AppCommandError("CTFtime is rate limiting us, try again later")
+        if response.status != 200:
+            raise app_commands.AppCommandError("Unknown team or server error")
+
+        search = parse_qs(urlparse(team_url).query).get("q")
+        if search:
+            Ctftime.cache_team_id(search[0], response.url)
+
+        soup = BeautifulSoup(response.text, "html.parser")
+        team_name = soup.find(class_="page-header").text.strip()
+
+        year_rating = soup.find(id=f"rating_{year}")
+        if year_rating is None:
+            raise app_commands.AppCommandError("Invalid year for this team")
+        _, tbl = Ctftime.get_table_from_html(year_rating.find("table"))
+
+        h3_tag = soup.find("h3", text="Organized CTF events")
+        organized_tag = h3_tag.find_next_sibling("table") if h3_tag else None
+
+        if organized_tag:
+            _, organized_tbl = Ctftime.get_table_from_html(organized_tag, raw=True)
+            for name, weight in organized_tbl:
+                event_id = name["href"].split("/")[-1]
+
+                response = await ctftime_scheduler.fetch(
+                    f"https://ctftime.org/api/v1/events/{event_id}/"
+                )
+                if response.status != 200:
+                    break
+                if int(response.json()["finish"][:4]) != year:
+                    break
+                tbl.append(["-", name.text, "-", str(float(weight.text)*2)])
+        tbl = sorted(tbl, key=lambda row: -float(row[3].replace("*","")))[:RATING_TOP_EVENTS]
+        s = sum(float(row[3].replace("*","")) for row in tbl)
+        return team_name, tbl, s
+
+    @staticmethod
+    async def get_team_rating(team_url, year) -> TeamRating:
+        rating = _team_ratings.get((team_url, year))
+        if rating is None or not rating.is_fresh():
+            rating = TeamRating(*await Ctftime.get_team_top10(team_url, year))
+            _team_ratings[team_url, year] = rating
+        return rating
 
 
     @app_commands.command(description="Display top teams for a specified year and/or country")
@@ -125,12 +211,16 @@ class Ctftime(app_commands.Group):
         if country is not None:
             stats_url += f"{country.upper()}"
 
-        async with aiohttp.ClientSession() as session, session.get(stats_url) as response:
-            if response.status != 200:
-                raise app_commands.AppCommandError("Unknown country")
+        # Requests may have to wait in the CTFtime queue
+        await interaction.response.defer()
+
+        response = await ctftime_scheduler.fetch(stats_url)
+        if response.status == 429:
+            raise app_commands.AppCommandError("CTFtime is rate limiting us, try again later")
+        if response.status != 200:
+            raise app_commands.AppCommandError("Unknown country")
 
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(response.text, "html.parser")
 
         if country is None:
             out = "**Showing top teams globally**"
@@ -150,7 +240,7 @@ class Ctftime(app_commands.Group):
             out = out[:out.rfind("\n")]
 
         out += "\n```"
-        await interaction.response.send_message(out)
+        await interaction.edit_original_response(content=out)
 
     @app_commands.command(description="Show top 10 events for a team")
     async def team(self, interaction: discord.Interaction, team: str | None, year: int | None):
@@ -164,16 +254,16 @@ class Ctftime(app_commands.Group):
 
         await interaction.response.defer()
 
-        team_name, tbl, total_points = await self.get_team_top10(url, year)
+        rating = await self.get_team_rating(url, year)
 
         tbl_str = tabulate(
-            tbl,
+            rating.events,
             headers=["Place", "Event", "CTF points", "Rating points"],
             floatfmt=".03f"
         )
-        points = f"{total_points:.03f}".rjust(tbl_str.index("\n") - 5, " ")
+        points = f"{rating.total:.03f}".rjust(tbl_str.index("\n") - 5, " ")
 
-        out = f"**Showing top {len(tbl)} events for {team_name}**\n"
+        out = f"**Showing top {len(rating.events)} events for {rating.team_name}**\n"
         out += f"```\n{tbl_str}\n\nTotal{points}```\n"
 
         if len(out) > 2000:
@@ -191,7 +281,7 @@ class Ctftime(app_commands.Group):
         team_place: int,
         team: str | None
     ):
-        new_score = (team_points/best_points + 1/team_place) * weight
+        new_score = rating_points(weight, best_points, team_points, team_place)
 
         await interaction.response.send_message(f"Rating points: {new_score:.03f}")
 
@@ -200,18 +290,74 @@ class Ctftime(app_commands.Group):
             return
 
         try:
-            team_name, tbl, old_rating = await self.get_team_top10(url, datetime.now().year)
+            rating = await self.get_team_rating(url, datetime.now().year)
         except Exception as e:
             print(e)
             return
 
-        old_score = float(tbl[-1][3])
-        new_rating = old_rating + max(new_score-old_score, 0)
-        score_diff = new_rating-old_rating
+        new_rating = rating.what_if(new_score)
+        score_diff = new_rating-rating.total
 
         await interaction.edit_original_response(
             content=f"Rating points: {new_score:.03f}\n"
-            f"New Rating for {team_name}: {new_rating:.03f} (+{score_diff:.03f})"
+            f"New Rating for {rating.team_name}: {new_rating:.03f} (+{score_diff:.03f})"
+        )
+
+    @app_commands.command(description="Calculate CTFTime scores for several results of a ctf")
+    @app_commands.describe(scenarios="Comma separated team_points:team_place, e.g. 1500:3, 900:10")
+    async def calcbatch(
+        self,
+        interaction: discord.Interaction,
+        weight: float,
+        best_points: float,
+        scenarios: str,
+        team: str | None
+    ):
+        results = []
+        for scenario in scenarios.split(","):
+            regex_scenario = re.search(r"^\s*(\d+(?:\.\d+)?)\s*:\s*(\d+)\s*$", scenario)
+            if not regex_scenario or int(regex_scenario.group(2)) < 1:
+                raise app_commands.AppCommandError(f"Invalid scenario \"{scenario.strip()}\"")
+            results.append((float(regex_scenario.group(1)), int(regex_scenario.group(2))))
+        if len(results) > MAX_CALC_SCENARIOS:
+            raise app_commands.AppCommandError(
+                f"Too many scenarios, at most {MAX_CALC_SCENARIOS} are allowed"
+            )
+
+        await interaction.response.defer()
+
+        rating = None
+        url = self.get_team_url(interaction, team)
+        if url is not None:
+            rating = await self.get_team_rating(url, datetime.now().year)
+
+        tbl = []
+        for team_points, team_place in results:
+            new_score = rating_points(weight, best_points, team_points, team_place)
+            row = [team_points, team_place, new_score]
+            if rating is not None:
+                new_rating = rating.what_if(new_score)
+                row += [new_rating, new_rating - rating.total]
+            tbl.append(row)
+
+        headers = ["CTF points", "Place", "Rating points"]
+        if rating is None:
+            out = "**Rating points per result**\n"
+        else:
+            headers += ["New rating", "Diff"]
+            out = f"**New rating for {rating.team_name}** (currently {rating.total:.03f})\n"
+        out += f"```\n{tabulate(tbl, headers=headers, floatfmt='.03f')}```"
+        await interaction.edit_original_response(content=out)
+
+    @app_commands.command(description="Show CTFtime request queue statistics")
+    async def status(self, interaction: discord.Interaction):
+        stats = ctftime_scheduler.stats()
+        await interaction.response.send_message(
+            f"Queue depth: {stats['queue_depth']} ({stats['in_flight']} in flight)\n"
+            f"Requests: {stats['completed']} ({stats['retries']} retried)\n"
+            f"Wait time: avg {stats['avg_wait']:.02f}s, "
+            f"p95 {stats['p95_wait']:.02f}s, max {stats['max_wait']:.02f}s",
+            ephemeral=True
         )
 
 
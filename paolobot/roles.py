@@ -0,0 +1,144 @@
+import asyncio
+import logging
+
+from typing import NamedTuple
+
+import discord
+
+from paolobot.metrics import spawn_background
+
+ROLE_WORKERS = 4
+PROGRESS_INTERVAL = 5
+
+
+class RoleJob:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.finished = asyncio.Event()
+        if total == 0:
+            self.finished.set()
+
+    def step(self, failed: bool = False):
+        self.done += 1
+        self.failed += failed
+        if self.done >= self.total:
+            self.finished.set()
+
+    def __str__(self):
+        out = f"{self.done}/{self.total}"
+        if self.failed:
+            out += f" ({self.failed} failed)"
+        return out
+
+
+class RoleChange(NamedTuple):
+    member: discord.Member
+    role: discord.Role
+    add: bool
+    reason: str | None
+    job: RoleJob | None
+
+
+class RoleQueue:
+    # Applies role changes in the background with bounded concurrency.
+    # A change that is still queued is replaced by later changes for the same member and role.
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pending: dict[tuple[int, int, int], RoleChange] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            # Not accounted to the command that started them
+            self._tasks.append(spawn_background(self._worker(), name="role-queue-worker"))
+
+    def _submit(self, change: RoleChange):
+        self._ensure_started()
+        key = (change.member.guild.id, change.member.id, change.role.id)
+        previous = self._pending.get(key)
+        self._pending[key] = change
+        if previous is None:
+            self._queue.put_nowait(key)
+        elif previous.job is not None:
+            previous.job.step()
+
+    def add(self, member: discord.Member, role: discord.Role, reason: str | None = None,
+            job: RoleJob | None = None):
+        self._submit(RoleChange(member, role, True, reason, job))
+
+    def remove(self, member: discord.Member, role: discord.Role, reason: str | None = None,
+               job: RoleJob | None = None):
+        self._submit(RoleChange(member, role, False, reason, job))
+
+    def add_many(self, members: list[discord.Member], role: discord.Role,
+                 reason: str | None = None) -> RoleJob:
+        job = RoleJob(len(members))
+        for member in members:
+            self.add(member, role, reason, job)
+        return job
+
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def join(self):
+        # Wait until every queued change has been applied
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                change = self._pending.pop(key, None)
+                if change is not None:
+                    await self._apply(change)
+            finally:
+                self._queue.task_done()
+
+    async def _apply(self, change: RoleChange):
+        failed = False
+        try:
+            # Skip the API call if the member is already in the wanted state
+            if change.add and change.role not in change.member.roles:
+                await change.member.add_roles(change.role, reason=change.reason)
+            elif not change.add and change.role in change.member.roles:
+                await change.member.remove_roles(change.role, reason=change.reason)
+        except discord.HTTPException as e:
+            logging.warning("Could not update role %s for %s: %s",
+                            change.role.name, change.member.name, e)
+            failed = True
+        finally:
+            if change.job is not None:
+                change.job.step(failed)
+
+
+def report_progress(job: RoleJob, message: discord.Message, content: str):
+    # Outlives the command, its edits are background calls
+    spawn_background(_report_progress(job, message, content))
+
+
+async def _report_progress(job: RoleJob, message: discord.Message, content: str):
+    # Keep a status message updated until the job is done
+    while not job.finished.is_set():
+        try:
+            await message.edit(content=f"{content}\nAdding roles: {job}")
+        except discord.HTTPException:
+            pass
+        try:
+            await asyncio.wait_for(job.finished.wait(), timeout=PROGRESS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        await message.edit(content=content if not job.failed else f"{content}\nAdding roles: {job}")
+    except discord.HTTPException:
+        pass
+
+
+role_queue = RoleQueue(ROLE_WORKERS)
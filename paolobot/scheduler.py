@@ -0,0 +1,186 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+
+from collections import deque
+from collections.abc import Mapping
+from typing import NamedTuple
+
+import aiohttp
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Tie-breaker for queued requests of the same priority, first come first served
+_sequence = itertools.count()
+
+
+class FetchResult(NamedTuple):
+    status: int
+    url: str
+    text: str
+    headers: Mapping[str, str]
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RetryPolicy(NamedTuple):
+    max_retries: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    timeout: float = 20.0
+
+
+class SchedulerStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.retries = 0
+        self.max_wait = 0.0
+        self.waits = deque(maxlen=200)
+
+    def add_wait(self, waited: float):
+        self.waits.append(waited)
+        self.max_wait = max(self.max_wait, waited)
+
+
+# Requests to a single host take turns in priority order and share one token bucket,
+# 429/5xx responses are retried with jittered exponential backoff
+class RequestScheduler:
+    def __init__(self, name: str, rate: float, burst: int, policy: RetryPolicy = RetryPolicy()):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.policy = policy
+        self.counters = SchedulerStats()
+
+        self._queue: asyncio.PriorityQueue | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(
+                self._dispatch(),
+                name=f"{self.name}-scheduler"
+            )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.policy.timeout)
+            )
+        return self._session
+
+    async def _dispatch(self):
+        while True:
+            _, _, grant = await self._queue.get()
+            if grant.done():
+                # Caller gave up while waiting in the queue
+                continue
+            await self.bucket.acquire()
+            if not grant.done():
+                grant.set_result(None)
+
+    async def _wait_turn(self, priority: int):
+        self._ensure_started()
+        grant = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(_sequence), grant))
+        start = time.monotonic()
+        await grant
+        self.counters.add_wait(time.monotonic() - start)
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        policy = self.policy
+        delay = min(policy.max_delay, policy.base_delay * 2 ** attempt)
+        delay *= random.uniform(0.5, 1.0)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), policy.max_delay))
+        return delay
+
+    async def fetch(
+        self,
+        url: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        headers: dict[str, str] | None = None
+    ) -> FetchResult:
+        attempt = 0
+        while True:
+            await self._wait_turn(priority)
+            self.counters.in_flight += 1
+            try:
+                async with self._get_session().get(url, headers=headers) as response:
+                    result = FetchResult(
+                        response.status,
+                        str(response.url),
+                        await response.text(),
+                        response.headers
+                    )
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.policy.max_retries:
+                    raise
+                result, retry_after = None, None
+            finally:
+                self.counters.in_flight -= 1
+
+            if result is not None and (
+                result.status not in RETRY_STATUSES or attempt >= self.policy.max_retries
+            ):
+                self.counters.completed += 1
+                return result
+
+            delay = self._backoff(attempt, retry_after)
+            logging.warning(
+                "%s request to %s failed (%s), retrying in %.1f seconds",
+                self.name, url, result.status if result else "connection error", delay
+            )
+            self.counters.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        counters = self.counters
+        waits = sorted(counters.waits)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": counters.in_flight,
+            "completed": counters.completed,
+            "retries": counters.retries,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "max_wait": counters.max_wait,
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
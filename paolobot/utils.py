@@ -1,13 +1,26 @@
+import asyncio
+import logging
 import re
+import time
 
 import discord
 from discord import app_commands
 
+from paolobot.channel_cache import (
+    get_category_positions,
+    get_occupancy,
+    channel_created,
+    channel_deleted,
+    channel_updated
+)
+from paolobot.metrics import spawn_background
 from paolobot.models.backup_category import BackupCategory
 from paolobot.models.guild_settings import GuildSettings
 
 MAX_CHANNELS = 500
 CATEGORY_MAX_CHANNELS = 50
+BACKUP_PRECREATE_THRESHOLD = CATEGORY_MAX_CHANNELS - 5
+BOOTSTRAP_CONCURRENCY = 5
 
 
 def get_category_pos(category_channel: discord.CategoryChannel, name: str) -> int:
@@ -16,61 +29,134 @@ def get_category_pos(category_channel: discord.CategoryChannel, name: str) -> in
     else:
         ctf, category, _ = name.split("-")
 
-    same_category_channel = None
-    same_ctf_channel = None
-    for channel in category_channel.text_channels:
-        if channel.name.startswith(f"{ctf}-"):
-            same_ctf_channel = channel
-        if category is None:
-            if channel.name.count("-") == 1:
-                same_category_channel = channel
-        elif channel.name.startswith(f"{ctf}-{category}-"):
-            same_category_channel = channel
-
-    if same_category_channel:
-        return same_category_channel.position
-    if same_ctf_channel:
-        return same_ctf_channel.position + 1
-    if category_channel.text_channels:
-        ctf_pos = category_channel.text_channels[-1].position // 1000 + 1
+    positions = get_category_positions(category_channel)
+
+    same_category_pos = positions.last_position((ctf, category))
+    if same_category_pos is not None:
+        return same_category_pos
+    same_ctf_pos = positions.last_position(ctf)
+    if same_ctf_pos is not None:
+        return same_ctf_pos + 1
+    last_pos = positions.last_position()
+    if last_pos is not None:
+        ctf_pos = last_pos // 1000 + 1
         return ctf_pos * 1000
     return 0
 
 
+class BackupAllocator:
+    # Overflow categories for full categories, with occupancy taken from the channel cache
+    def __init__(self):
+        self._backups: dict[int, list[tuple[int, int]]] | None = None
+        self._originals: dict[int, int] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def _load(self):
+        if self._backups is None:
+            self._backups = {}
+            for backup in BackupCategory.objects.order_by("index"):
+                self._add(backup.original_id, backup.index, backup.category_id)
+
+    def _add(self, original_id: int, index: int, category_id: int):
+        self._backups.setdefault(original_id, []).append((index, category_id))
+        self._originals[category_id] = original_id
+
+    def _find(
+            self,
+            original_category: discord.CategoryChannel,
+            limit: int
+        ) -> discord.CategoryChannel | None:
+        for _, category_id in self._backups.get(original_category.id, []):
+            category = original_category.guild.get_channel(category_id)
+            if category is not None and get_occupancy(category) < limit:
+                return category
+        return None
+
+    async def get(
+            self,
+            original_category: discord.CategoryChannel,
+            limit: int = CATEGORY_MAX_CHANNELS
+        ) -> discord.CategoryChannel:
+        self._load()
+        # Looked up under the lock, free() may be deleting an empty backup meanwhile
+        async with self._locks.setdefault(original_category.id, asyncio.Lock()):
+            if category := self._find(original_category, limit):
+                return category
+
+            backups = self._backups.get(original_category.id)
+            idx = backups[-1][0] + 1 if backups else 2
+            new_category = await original_category.guild.create_category(
+                f"{original_category.name} {idx}", position=original_category.position
+            )
+            backup_category = BackupCategory(
+                original_id=original_category.id,
+                category_id=new_category.id,
+                index=idx
+            )
+            backup_category.save()
+            self._add(original_category.id, idx, new_category.id)
+            return new_category
+
+    def prepare(self, category: discord.CategoryChannel):
+        # Create the next overflow category ahead of time when a category is nearly full
+        if get_occupancy(category) < BACKUP_PRECREATE_THRESHOLD:
+            return
+        self._load()
+        original_id = self._originals.get(category.id, category.id)
+        original_category = category.guild.get_channel(original_id)
+        if original_category is None or self._find(original_category, BACKUP_PRECREATE_THRESHOLD):
+            return
+
+        # Created in the background, not as part of the command that filled the category
+        spawn_background(self.get(original_category, BACKUP_PRECREATE_THRESHOLD))
+
+    async def free(self, category: discord.CategoryChannel | None):
+        # Called for the original or backup category a channel just left
+        if category is None:
+            return
+        self._load()
+        original_id = self._originals.get(category.id, category.id)
+        if not self._backups.get(original_id):
+            return
+
+        guild = category.guild
+        original_category = guild.get_channel(original_id)
+        async with self._locks.setdefault(original_id, asyncio.Lock()):
+            empty = [
+                backup for _, category_id in self._backups[original_id]
+                if (backup := guild.get_channel(category_id)) is not None
+                and get_occupancy(backup) == 0
+            ]
+            # Keep one empty category as the next overflow while the original is nearly full
+            if original_category and get_occupancy(original_category) >= BACKUP_PRECREATE_THRESHOLD:
+                empty = empty[1:]
+
+            for backup in empty:
+                del self._originals[backup.id]
+                self._backups[original_id] = [
+                    entry for entry in self._backups[original_id] if entry[1] != backup.id
+                ]
+                BackupCategory.objects(category_id=backup.id).delete()
+                await backup.delete(reason="Removing unused backup category")
+
+
+backup_allocator = BackupAllocator()
+
+
 async def get_backup_category(
         original_category: discord.CategoryChannel
     ) -> discord.CategoryChannel:
-    last_backup = None
-    for cat in BackupCategory.objects(original_id=original_category.id).order_by("index"):
-        last_backup = cat
-        category = original_category.guild.get_channel(cat["category_id"])
-        if len(category.channels) < CATEGORY_MAX_CHANNELS:
-            return category
-
-    idx = 2 if not last_backup else last_backup["index"]+1
-    new_category = await original_category.guild.create_category(
-        f"{original_category.name} {idx}", position=original_category.position
-    )
-    backup_category = BackupCategory(
-        original_id=original_category.id,
-        category_id=new_category.id,
-        index=idx
-    )
-    backup_category.save()
-    return new_category
+    return await backup_allocator.get(original_category)
 
 
-async def free_backup_category(category: discord.CategoryChannel):
-    if len(category.channels) == 0:
-        backup_category = BackupCategory.objects(category_id=category.id).first()
-        if backup_category is not None:
-            backup_category.delete()
-            await category.delete(reason="Removing unused backup category")
+async def free_backup_category(category: discord.CategoryChannel | None):
+    await backup_allocator.free(category)
 
 
 async def delete_channel(channel: discord.TextChannel):
     original_category = channel.category
     await channel.delete(reason="Deleted CTF channels")
+    channel_deleted(channel)
     await free_backup_category(original_category)
 
 
@@ -80,14 +166,20 @@ async def create_channel(
         category: discord.CategoryChannel,
         challenge=True
     ) -> discord.TextChannel:
-    if len(category.channels) == CATEGORY_MAX_CHANNELS:
+    if get_occupancy(category) >= CATEGORY_MAX_CHANNELS:
         category = await get_backup_category(category)
 
     if challenge:
         pos = get_category_pos(category, name)
-        return await category.create_text_channel(name, overwrites=overwrites, position=pos)
+        new_channel = await category.create_text_channel(
+            name, overwrites=overwrites, position=pos
+        )
+    else:
+        new_channel = await category.create_text_channel(name, overwrites=overwrites)
 
-    return await category.create_text_channel(name, overwrites=overwrites)
+    channel_created(new_channel)
+    backup_allocator.prepare(category)
+    return new_channel
 
 
 async def move_channel(
@@ -98,17 +190,20 @@ async def move_channel(
     if goal_category == channel.category:
         return
 
-    if len(goal_category.channels) == CATEGORY_MAX_CHANNELS:
+    if get_occupancy(goal_category) >= CATEGORY_MAX_CHANNELS:
         goal_category = await get_backup_category(goal_category)
 
     original_category = channel.category
 
     if challenge:
         pos = get_category_pos(goal_category, channel.name)
-        await channel.edit(category=goal_category, position=pos)
+        moved_channel = await channel.edit(category=goal_category, position=pos)
     else:
-        await channel.edit(category=goal_category)
+        moved_channel = await channel.edit(category=goal_category)
 
+    if moved_channel is not None:
+        channel_updated(channel, moved_channel)
+    backup_allocator.prepare(goal_category)
     await free_backup_category(original_category)
 
 
@@ -169,6 +264,7 @@ def _discord_create(
 
 
 async def setup_settings(guild: discord.Guild):
+    start = time.perf_counter()
     settings = GuildSettings.objects(guild_id=guild.id).first()
     if settings is None:
         settings = GuildSettings(guild_id=guild.id)
@@ -199,11 +295,35 @@ async def setup_settings(guild: discord.Guild):
     settings.save()
 
     # Add guild admins to admin and team roles
+    roles = [guild.get_role(settings.admin_role), guild.get_role(settings.team_role)]
     for member in guild.members:
         if member.guild_permissions.administrator and member != guild.me:
-            await member.add_roles(
-                guild.get_role(settings.admin_role),
-                guild.get_role(settings.team_role)
+            missing_roles = [role for role in roles if role and role not in member.roles]
+            if missing_roles:
+                await member.add_roles(*missing_roles)
+
+    logging.info("Set up guild \"%s\" in %.2f seconds", guild.name, time.perf_counter() - start)
+
+
+async def setup_all_settings(guilds: list[discord.Guild]):
+    semaphore = asyncio.Semaphore(BOOTSTRAP_CONCURRENCY)
+
+    async def setup_guild(guild: discord.Guild):
+        async with semaphore:
+            await setup_settings(guild)
+
+    # A failing guild is logged and does not stop the others
+    results = await asyncio.gather(
+        *(setup_guild(guild) for guild in guilds),
+        return_exceptions=True
+    )
+    for guild, result in zip(guilds, results):
+        if isinstance(result, Exception):
+            logging.error(
+                "Could not set up guild \"%s\": %s",
+                guild.name,
+                result,
+                exc_info=result
             )
 
 
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from paolobot.metrics import current_command, observe
+
+HEARTBEAT_INTERVAL = 0.1
+
+
+class LoopWatchdog:
+    # The heartbeat samples event loop lag for the metrics. With a threshold, a thread logs the
+    # stack of the event loop thread when no heartbeat arrives for `threshold` seconds.
+    def __init__(self, threshold: float | None):
+        self.threshold = threshold
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._heartbeat = time.monotonic()
+        self._stop = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._loop.call_later(HEARTBEAT_INTERVAL, self._beat)
+        if self.threshold:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        now = time.monotonic()
+        observe("event_loop_lag_seconds", max(now - self._heartbeat - HEARTBEAT_INTERVAL, 0.0))
+        self._heartbeat = now
+        if not self._stop.is_set():
+            self._loop.call_later(HEARTBEAT_INTERVAL, self._beat)
+
+    def _describe_task(self) -> str:
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return "outside of any task"
+        timing = task.get_context().get(current_command)
+        if timing is not None:
+            return f"in task {task.get_name()} running /{timing.name}"
+        return f"in task {task.get_name()}"
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+            stack = "".join(traceback.format_stack(frame)) if frame else "unknown"
+            logging.warning(
+                "Event loop stalled for %.2f seconds %s\n%s",
+                stalled, self._describe_task(), stack
+            )
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from paolobot.metrics import spawn_background
+from paolobot.models.challenge import Challenge
+from paolobot.models.ctf import Ctf
+
+WORK_FLUSH_INTERVAL = 2.0
+WORK_MAX_DIRTY = 50
+
+
+class ChallengeWork:  # pylint: disable=too-many-instance-attributes
+    # A challenge of a loaded CTF and its row in the CTF work matrix
+    def __init__(self, ctf_work: "CtfWork", chall: Challenge, row: int):
+        self.ctf_work = ctf_work
+        self.id = chall.id
+        self.row = row
+        self.refresh(chall)
+
+    def refresh(self, chall: Challenge):
+        self.name = chall.name
+        self.category = chall.category
+        self.solved = chall.solved
+        self.channel_id = chall.channel_id
+        self.work_message = chall.work_message
+
+    @property
+    def users(self) -> dict[int, int]:
+        # User ID to work value, in the order the users first worked on the CTF
+        ctf_work = self.ctf_work
+        values = ctf_work.matrix[self.row, :len(ctf_work.user_ids)]
+        return {ctf_work.user_ids[col]: int(values[col]) for col in np.flatnonzero(values)}
+
+    def to_mongo(self) -> list[dict]:
+        return [{"user": user, "value": value} for user, value in self.users.items()]
+
+
+class CtfWork:
+    # Work values of a CTF as a challenge x user uint8 matrix, grown by doubling
+    def __init__(self, challs: list[Challenge]):
+        self.matrix = np.zeros((max(len(challs), 8), 8), dtype=np.uint8)
+        self.challenges: dict[ObjectId, ChallengeWork] = {}
+        self.rows: list[ChallengeWork | None] = []
+        self.user_ids: list[int] = []
+        self.user_columns: dict[int, int] = {}
+        for chall in challs:
+            chall_work = self.add(chall)
+            for work in chall.working:
+                # The column lookup may replace the matrix, index it afterwards
+                col = self._column(work.user)
+                self.matrix[chall_work.row, col] = work.value
+
+    def _grow(self, rows: int, cols: int):
+        # Only the dimension that overflowed is doubled
+        height, width = self.matrix.shape
+        if rows <= height and cols <= width:
+            return
+        new_height = max(rows, height * 2) if rows > height else height
+        new_width = max(cols, width * 2) if cols > width else width
+        matrix = np.zeros((new_height, new_width), dtype=np.uint8)
+        matrix[:height, :width] = self.matrix
+        self.matrix = matrix
+
+    def _column(self, user: int) -> int:
+        if user not in self.user_columns:
+            self._grow(self.matrix.shape[0], len(self.user_ids) + 1)
+            self.user_columns[user] = len(self.user_ids)
+            self.user_ids.append(user)
+        return self.user_columns[user]
+
+    def add(self, chall: Challenge) -> ChallengeWork:
+        # Rows of removed challenges are not reused, they stay zero
+        self._grow(len(self.rows) + 1, self.matrix.shape[1])
+        chall_work = ChallengeWork(self, chall, len(self.rows))
+        self.challenges[chall.id] = chall_work
+        self.rows.append(chall_work)
+        return chall_work
+
+    def remove(self, chall_id: ObjectId):
+        if chall_work := self.challenges.pop(chall_id, None):
+            self.matrix[chall_work.row] = 0
+            self.rows[chall_work.row] = None
+
+    def set(self, chall_work: ChallengeWork, user: int, value: int) -> bool:
+        if value == 0 and user not in self.user_columns:
+            return False
+        col = self._column(user)
+        if self.matrix[chall_work.row, col] == value:
+            return False
+        self.matrix[chall_work.row, col] = value
+        return True
+
+    def demote(self, chall_work: ChallengeWork, user: int) -> list[ChallengeWork]:
+        # Flip "Working" to "Has Worked" on the user's other challenges
+        if user not in self.user_columns:
+            return []
+        column = self.matrix[:, self.user_columns[user]]
+        rows = np.flatnonzero(column == 1)
+        rows = rows[rows != chall_work.row]
+        column[rows] = 2
+        return [self.rows[row] for row in rows]
+
+    def table(self, challs: list[ChallengeWork]) -> tuple[np.ndarray, list[int]]:
+        # Work values of the given challenges, only for users that worked on one of them
+        work = self.matrix[[chall.row for chall in challs], :len(self.user_ids)]
+        cols = np.flatnonzero(work.any(axis=0))
+        return work[:, cols], [self.user_ids[col] for col in cols]
+
+
+class WorkBuffer:
+    # Working state is kept in memory per CTF, loaded on first use, and is authoritative once
+    # loaded. Changed challenges are written back with one bulk_write after flush_interval,
+    # or right away once max_dirty challenges are waiting, which bounds what a crash can lose.
+    def __init__(self, flush_interval: float, max_dirty: int):
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._ctfs: dict[ObjectId, CtfWork] = {}
+        self._dirty: dict[ObjectId, ChallengeWork] = {}
+        self._flusher: asyncio.Task | None = None
+
+    def get_ctf(self, ctf_db: Ctf) -> CtfWork:
+        if ctf_db.id not in self._ctfs:
+            self._ctfs[ctf_db.id] = CtfWork(list(Challenge.objects(ctf=ctf_db).only(
+                "name", "category", "solved", "channel_id", "work_message", "working"
+            )))
+        return self._ctfs[ctf_db.id]
+
+    def get(self, chall_db: Challenge) -> ChallengeWork:
+        ctf_work = self.get_ctf(chall_db.ctf)
+        if chall_db.id not in ctf_work.challenges:
+            # Challenge was added after the CTF was loaded
+            return ctf_work.add(chall_db)
+        return ctf_work.challenges[chall_db.id]
+
+    def refresh(self, chall_db: Challenge):
+        # Pick up a new challenge or changed details, a CTF that is not loaded reads them later
+        if chall_db.ctf.id in self._ctfs:
+            self.get(chall_db).refresh(chall_db)
+
+    def remove(self, ctf_db: Ctf, chall_id: ObjectId):
+        if ctf_work := self._ctfs.get(ctf_db.id):
+            ctf_work.remove(chall_id)
+        self._dirty.pop(chall_id, None)
+
+    def set(self, chall_db: Challenge, user_id: int, value: int) -> ChallengeWork | None:
+        chall_work = self.get(chall_db)
+        if not chall_work.ctf_work.set(chall_work, user_id, value):
+            return None
+        self._mark_dirty(chall_work)
+        return chall_work
+
+    def demote(self, ctf_db: Ctf, chall_db: Challenge, user_id: int) -> list[ChallengeWork]:
+        chall_work = self.get(chall_db)
+        demoted = self.get_ctf(ctf_db).demote(chall_work, user_id)
+        for other in demoted:
+            self._mark_dirty(other)
+        return demoted
+
+    def drop_ctf(self, ctf_db: Ctf):
+        ctf_work = self._ctfs.pop(ctf_db.id, None)
+        if ctf_work is not None:
+            for chall_id in ctf_work.challenges:
+                self._dirty.pop(chall_id, None)
+
+    def _mark_dirty(self, chall_work: ChallengeWork):
+        self._dirty[chall_work.id] = chall_work
+        if len(self._dirty) >= self.max_dirty:
+            self.flush()
+        elif self._flusher is None or self._flusher.done():
+            # Not accounted to the command that scheduled it
+            self._flusher = spawn_background(self._flush_later(), name="work-flush")
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self.flush()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        requests = [
+            UpdateOne({"_id": chall_id}, {"$set": {"working": chall_work.to_mongo()}})
+            for chall_id, chall_work in dirty.items()
+        ]
+        try:
+            collection = Challenge._get_collection()  # pylint: disable=protected-access
+            collection.bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            logging.error("Could not write working state of %d challenges: %s", len(dirty), e)
+            # Retry with the next flush unless the challenge changed again in the meantime
+            for chall_id, chall_work in dirty.items():
+                self._dirty.setdefault(chall_id, chall_work)
+
+
+work_buffer = WorkBuffer(WORK_FLUSH_INTERVAL, WORK_MAX_DIRTY)
@@ -0,0 +1,34 @@
+# Tests run the command handlers against the simulated guild in benchmarks/fakes.py and an
+# in-process mongomock database, no Discord connection or MongoDB needed.
+# Requires benchmarks/requirements.txt.
+
+import os
+import tempfile
+
+import mongomock
+
+from mongoengine import connect
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("BACKUPS_DIR", tempfile.mkdtemp(prefix="paolobot_test_"))
+
+# Registered before any test imports a paolobot module
+connect(db="paolobot_test", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+
+# pylint: disable=wrong-import-position
+import pytest  # noqa: E402
+
+from paolobot.roles import role_queue  # noqa: E402
+from paolobot.work_state import work_buffer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_background_state():
+    # Every test runs its own event loop, queues and tasks of the previous one cannot be reused
+    yield
+    # pylint: disable=protected-access
+    work_buffer.flush()
+    work_buffer._flusher = None
+    role_queue._queue = None
+    role_queue._tasks = []
+    role_queue._pending.clear()
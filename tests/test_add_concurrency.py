@@ -0,0 +1,46 @@
+# Fires many /add submissions at once and checks that no category use is lost
+
+import asyncio
+
+from benchmarks.fakes import FakeInteraction, api, create_ctf, setup_guild
+from paolobot.autocomplete import get_category_index
+from paolobot.models.challenge import Challenge
+from paolobot.models.ctf_category import CtfCategory
+from paolobot.modules.challenge import add
+from paolobot.utils import get_settings
+
+SUBMISSIONS = 50
+
+
+async def submit_all(count: int):
+    guild = await setup_guild(5)
+    get_settings(guild).update(enforce_categories=False)
+    ctf_db = await create_ctf(guild, f"concurrency_{guild.id}")
+    ctf_channel = guild.get_channel(ctf_db.channel_id)
+
+    modals = []
+    for i in range(count):
+        interaction = FakeInteraction(guild, ctf_channel, guild.admin)
+        await add.callback(interaction, "web", f"chall{i}")
+        modal = interaction.response.modal
+        modal.description_field._value = "Description"  # pylint: disable=protected-access
+        modals.append(modal)
+
+    # Simulated API latency makes the submissions interleave at every Discord call
+    api.latency = 0.001
+    try:
+        await asyncio.gather(*(
+            modal.on_submit(FakeInteraction(guild, ctf_channel, guild.admin))
+            for modal in modals
+        ))
+    finally:
+        api.latency = 0
+    return guild, ctf_db
+
+
+def test_parallel_add_counts_every_category_use():
+    guild, ctf_db = asyncio.run(submit_all(SUBMISSIONS))
+
+    assert Challenge.objects(ctf=ctf_db).count() == SUBMISSIONS
+    assert CtfCategory.objects(name="web", guild_id=guild.id).first().count == SUBMISSIONS
+    assert get_category_index(guild.id).weight("web") == SUBMISSIONS
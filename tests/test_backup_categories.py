@@ -0,0 +1,38 @@
+# Overflow categories are created ahead of time and removed once the original drains
+
+import asyncio
+
+from benchmarks.fakes import setup_guild
+from paolobot.utils import (
+    BACKUP_PRECREATE_THRESHOLD,
+    create_channel,
+    delete_channel,
+    get_incomplete_category
+)
+
+
+def category_names(guild) -> list[str]:
+    return [category.name for category in guild.categories]
+
+
+async def fill_and_drain():
+    guild = await setup_guild(0)
+    incomplete_category = get_incomplete_category(guild)
+    channels = [
+        await create_channel(f"chall{i}", {}, incomplete_category, challenge=False)
+        for i in range(BACKUP_PRECREATE_THRESHOLD + 1)
+    ]
+    # Let the background pre-creation finish
+    await asyncio.sleep(0.05)
+    filled = category_names(guild)
+
+    for channel in channels[:10]:
+        await delete_channel(channel)
+    return filled, category_names(guild)
+
+
+def test_empty_backup_is_removed_when_original_drains():
+    filled, drained = asyncio.run(fill_and_drain())
+
+    assert "INCOMPLETE CHALLENGES 2" in filled
+    assert "INCOMPLETE CHALLENGES 2" not in drained
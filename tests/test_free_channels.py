@@ -0,0 +1,50 @@
+# Freeing channels skips archived CTFs that cannot be exported instead of failing the command
+
+import asyncio
+
+from types import SimpleNamespace
+
+import discord
+
+from benchmarks.fakes import ctf_commands, create_ctf, setup_guild, FakeInteraction
+from paolobot.models.ctf import Ctf
+from paolobot.modules.ctf import free_channels
+from paolobot.roles import role_queue
+from paolobot.utils import get_export_channel
+
+
+async def free_with_failing_upload():
+    guild = await setup_guild(0)
+    ctfs = [await create_ctf(guild, f"free{i}_{guild.id}") for i in range(2)]
+    await role_queue.join()
+    for ctf_db in ctfs:
+        ctf_channel = guild.get_channel(ctf_db.channel_id)
+        await ctf_commands.archive.callback(
+            ctf_commands, FakeInteraction(guild, ctf_channel, guild.admin)
+        )
+
+    # The export of the oldest CTF is too large to upload
+    export_channel = get_export_channel(guild)
+    send = export_channel.send
+    uploads = []
+
+    async def failing_send(*args, **kwargs):
+        uploads.append(kwargs)
+        if len(uploads) == 1:
+            for file in kwargs.get("files", []):
+                file.close()
+            raise discord.HTTPException(SimpleNamespace(status=413, reason="Too large"), "")
+        return await send(*args, **kwargs)
+
+    export_channel.send = failing_send
+    free = await free_channels(guild, 1000)
+    return guild, ctfs, free
+
+
+def test_failing_export_is_skipped():
+    guild, ctfs, free = asyncio.run(free_with_failing_upload())
+
+    assert Ctf.objects(id=ctfs[0].id).first() is not None
+    assert Ctf.objects(id=ctfs[1].id).first() is None
+    assert guild.get_channel(ctfs[0].channel_id) is not None
+    assert free > 0
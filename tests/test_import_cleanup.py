@@ -0,0 +1,53 @@
+# A failed /import removes the channels it already created
+
+import asyncio
+import json
+
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from benchmarks.ctfd_stub import make_challenges
+from benchmarks.fakes import (
+    FakeAttachment,
+    FakeInteraction,
+    FakeTextChannel,
+    create_ctf,
+    setup_guild
+)
+from paolobot.models.challenge import Challenge
+from paolobot.modules.challenge import import_challenges
+from paolobot.roles import role_queue
+from paolobot.utils import get_settings
+
+IMPORTS = 10
+
+
+async def import_with_failing_post():
+    guild = await setup_guild(0)
+    get_settings(guild).update(enforce_categories=False)
+    ctf_db = await create_ctf(guild, f"import_{guild.id}")
+    await role_queue.join()
+    before = {channel.id for channel in guild.channels}
+
+    content = json.dumps({"success": True, "data": make_challenges(IMPORTS)}).encode()
+    interaction = FakeInteraction(guild, guild.get_channel(ctf_db.channel_id), guild.admin)
+    with pytest.raises(discord.HTTPException):
+        await import_challenges.callback(interaction, FakeAttachment("challenges.json", content))
+    return guild, ctf_db, before
+
+
+def test_failed_import_leaves_no_channels(monkeypatch):
+    send = FakeTextChannel.send
+
+    async def failing_send(self, *args, **kwargs):
+        if self.name.endswith("challenge_3"):
+            raise discord.HTTPException(SimpleNamespace(status=500, reason="Server Error"), "")
+        return await send(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeTextChannel, "send", failing_send)
+    guild, ctf_db, before = asyncio.run(import_with_failing_post())
+
+    assert {channel.id for channel in guild.channels} == before
+    assert Challenge.objects(ctf=ctf_db).count() == 0
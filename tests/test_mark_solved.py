@@ -0,0 +1,55 @@
+# A challenge that cannot be moved to done stays unsolved, the rest of the batch goes through
+
+import asyncio
+
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from benchmarks.fakes import FakeTextChannel, create_ctf, setup_guild
+from paolobot.models.challenge import Challenge
+from paolobot.modules.challenge import mark_solved
+from paolobot.roles import role_queue
+from paolobot.utils import create_channel, get_complete_category, get_incomplete_category
+
+CHALLENGES = 3
+
+
+async def solve_with_failing_move():
+    guild = await setup_guild(0)
+    ctf_db = await create_ctf(guild, f"solve_{guild.id}")
+    await role_queue.join()
+    ctf_channel = guild.get_channel(ctf_db.channel_id)
+
+    challs = []
+    for i in range(CHALLENGES):
+        channel = await create_channel(
+            f"{ctf_db.name}-chall{i}", ctf_channel.overwrites, get_incomplete_category(guild)
+        )
+        challs.append(Challenge(name=f"chall{i}", channel_id=channel.id, ctf=ctf_db).save())
+
+    with pytest.raises(discord.HTTPException):
+        await mark_solved(guild, ctf_db, [(chall, [guild.admin.id]) for chall in challs])
+    return guild, ctf_channel, challs
+
+
+def test_failed_move_is_not_saved(monkeypatch):
+    edit = FakeTextChannel.edit
+
+    async def failing_edit(self, **options):
+        if "category" in options and self.name.endswith("chall1"):
+            raise discord.HTTPException(SimpleNamespace(status=500, reason="Server Error"), "")
+        return await edit(self, **options)
+
+    monkeypatch.setattr(FakeTextChannel, "edit", failing_edit)
+    guild, ctf_channel, challs = asyncio.run(solve_with_failing_move())
+
+    solved = {chall.name for chall in Challenge.objects(ctf=challs[0].ctf, solved=True)}
+    assert solved == {"chall0", "chall2"}
+    complete_category = get_complete_category(guild)
+    for chall in challs:
+        channel = guild.get_channel(chall.channel_id)
+        assert (channel.category_id == complete_category.id) == (chall.name in solved)
+    announced = ctf_channel.messages[-1].content
+    assert announced.count("was solved by") == 2